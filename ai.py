@@ -0,0 +1,192 @@
+"""
+AI player for myTetris
+
+Enumerates every rotation / column drop of the current piece on the bitboard, scores the
+resulting boards with a weighted heuristic (aggregate height, cleared lines, holes,
+bumpiness) and looks one piece ahead using game.next_figure. Board evaluations are
+memoized in a bounded LRU keyed by the board rows, so boards reached through more than one
+pair of placements are not re-scored.
+
+Works on engine.Tetris, so it drives both the live game (press 'A' in myTetris, where a
+Planner spreads each search over a few frames) and headless runs:
+    python selfplay.py --policy ai:policy
+"""
+
+import time
+from functools import lru_cache
+
+from bitboard import PAD
+from engine import Direction
+from pieces import PIECES
+
+# (aggregate height, cleared lines, holes, bumpiness)
+WEIGHTS = (-0.510066, 0.760666, -0.35663, -0.184483)
+# Boards repeat within one search (the same two pieces placed in the other order), hardly
+# ever across pieces, so the cache only needs to hold one search's worth
+CACHE_SIZE = 1 << 12
+
+
+def column_tops(rows, width, height):
+    # Highest filled row of every column, height for an empty one
+    full = ((1 << width) - 1) << PAD
+    tops = [height] * width
+    seen = 0
+    for i in range(height):
+        new = rows[i] & full & ~seen
+        while new:
+            bit = new & -new
+            tops[bit.bit_length() - 1 - PAD] = i
+            new ^= bit
+        seen |= rows[i]
+    return tops
+
+
+def placements(rows, figure_type, width, height, y=0):
+    # Yield (rotation, x, rows after lock, cleared lines) for every straight drop
+    solid = rows[height]
+    tops = column_tops(rows, width, height)
+    for rotation, shape in enumerate(PIECES[figure_type].rotations):
+        masks = shape.masks
+        bottoms = shape.column_bottoms
+        for x in range(-shape.left, width - shape.right):
+            shift = x + PAD
+            if any(rows[y + dy] & (m << shift) for dy, m in masks):
+                continue
+            # a piece above the surface lands where its lowest cell in some column meets that
+            # column's top (see BitBoard.drop_y); one tucked under an overhang is moved down
+            drop_y = min(tops[x + dx] - 1 - bottom for dx, bottom in bottoms)
+            if drop_y < y:
+                drop_y = y
+                while not any(rows[drop_y + 1 + dy] & (m << shift) for dy, m in masks):
+                    drop_y += 1
+            new_rows = list(rows)
+            lines = 0
+            for dy, m in masks:
+                new_rows[drop_y + dy] |= m << shift
+                lines += new_rows[drop_y + dy] == solid
+            if lines:
+                wall = solid ^ (((1 << width) - 1) << PAD)
+                new_rows = [wall] * lines + [r for r in new_rows[:height] if r != solid] + new_rows[height:]
+            yield rotation, x, tuple(new_rows), lines
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def evaluate(rows, width, height, weights=WEIGHTS):
+    full = ((1 << width) - 1) << PAD
+    seen = 0
+    filled = 0
+    heights = [0] * width
+    for i in range(height):
+        row = rows[i] & full
+        if not row:
+            continue
+        filled += row.bit_count()
+        new = row & ~seen
+        seen |= new
+        while new:
+            bit = new & -new
+            heights[bit.bit_length() - 1 - PAD] = height - i
+            new ^= bit
+    # every cell under a column's top that is not filled is a hole
+    holes = sum(heights) - filled
+    bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+    w_height, _, w_holes, w_bumpiness = weights
+    return w_height * sum(heights) + w_holes * holes + w_bumpiness * bumpiness
+
+
+def position(game):
+    # (rows, figure type, figure y, next figure type, width, height) of the game right now
+    next_type = game.next_figure.type if game.next_figure is not None else None
+    return tuple(game.board.rows), game.figure.type, game.figure.y, next_type, game.width, game.height
+
+
+def moves_to(figure, target):
+    # Directions that take figure from where it is to the (rotation, x) target, then drop it
+    if target is None:
+        return [Direction.DROP]
+    rotation, x = target
+    moves = [Direction.ROTATE] * ((rotation - figure.rotation) % figure.piece.count)
+    dx = x - figure.x
+    moves += [Direction.LEFT if dx < 0 else Direction.RIGHT] * abs(dx)
+    moves.append(Direction.DROP)
+    return moves
+
+
+class Player:
+    def __init__(self, weights=WEIGHTS, lookahead=True):
+        self.weights = weights
+        self.lookahead = lookahead
+
+    def best_placement(self, game):
+        # (rotation, x) of the best lock position for game.figure, or None if nothing fits
+        return self.search(*position(game))
+
+    def search(self, rows, figure_type, y, next_type, width, height):
+        # best_placement() on a position() snapshot
+        best = None
+        for best in self.search_steps(rows, figure_type, y, next_type, width, height):
+            pass
+        return best
+
+    def search_steps(self, rows, figure_type, y, next_type, width, height):
+        # The search as a generator that yields the best (rotation, x) so far after every
+        # board it scores, so it can be stopped and resumed; the last one is the result
+        w_lines = self.weights[1]
+        best, best_score = None, None
+        for rotation, x, after, lines in placements(rows, figure_type, width, height, y):
+            score = None
+            if self.lookahead and next_type is not None:
+                spawn_y = PIECES[next_type].spawn(width)[1]
+                for _, _, after2, lines2 in placements(after, next_type, width, height, spawn_y):
+                    score2 = w_lines * (lines + lines2) + evaluate(after2, width, height, self.weights)
+                    if score is None or score2 > score:
+                        score = score2
+                    yield best
+            if score is None:
+                score = w_lines * lines + evaluate(after, width, height, self.weights)
+            if best_score is None or score > best_score:
+                best, best_score = (rotation, x), score
+            yield best
+
+    def moves(self, game):
+        # Directions that take game.figure from where it is to the best placement
+        return moves_to(game.figure, self.best_placement(game))
+
+    @staticmethod
+    def cache_info():
+        return evaluate.cache_info()
+
+
+default_player = Player()
+
+
+def policy(game):
+    return default_player.moves(game)
+
+
+# Spreads a Player search over frames, so a slow one never holds up a frame: request()
+# snapshots the game, and update(), called once a frame like MusicPlayer.update(), searches
+# for about budget seconds and hands over the moves once the search is done
+class Planner:
+    def __init__(self, player=default_player, budget=0.004):
+        self.player = player
+        self.budget = budget
+        self.figure = None
+        self.steps = None
+        self.best = None
+
+    def request(self, game):
+        self.figure = game.figure
+        self.steps = self.player.search_steps(*position(game))
+        self.best = None
+
+    def update(self, game):
+        # Moves for game.figure once its search is done, None while it is still running
+        if self.steps is None or game.figure is not self.figure:
+            return None
+        deadline = time.perf_counter() + self.budget
+        for self.best in self.steps:
+            if time.perf_counter() >= deadline:
+                return None
+        self.steps = None
+        return moves_to(game.figure, self.best)
@@ -0,0 +1,70 @@
+"""
+Per-frame allocation counter for myTetris, a debugging aid
+
+AllocationCounter runs tracemalloc and records, for every frame between frame_start() and
+frame_end(), how many bytes were allocated on top of what was live when the frame began
+(the traced peak), how many bytes and memory blocks were still allocated at its end, and
+how many garbage collections ran during it. A steady-state frame should allocate next to
+nothing and never trigger the garbage collector. tracemalloc makes everything a lot slower,
+so the game only uses this when ALLOC_DEBUG is set.
+"""
+
+import gc
+import sys
+import tracemalloc
+from array import array
+
+FIELDS = ('peak_bytes', 'net_bytes', 'net_blocks', 'collections')
+
+
+class AllocationCounter:
+    def __init__(self, size=600):
+        # ring buffers, preallocated so recording a frame does not allocate anything that lives on
+        self.size = size
+        self.samples = {field: array('q', bytes(8 * size)) for field in FIELDS}
+        self.count = 0
+        self.base_bytes = 0
+        self.base_blocks = 0
+        self.collections = 0
+
+    def start(self):
+        tracemalloc.start()
+        gc.callbacks.append(self._on_gc)
+
+    def stop(self):
+        gc.callbacks.remove(self._on_gc)
+        tracemalloc.stop()
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self.collections += 1
+
+    def frame_start(self):
+        self.collections = 0
+        tracemalloc.reset_peak()
+        self.base_blocks = sys.getallocatedblocks()
+        self.base_bytes = tracemalloc.get_traced_memory()[0]
+
+    def frame_end(self):
+        # the ints read here are allocations themselves: store each one before taking the next
+        slot = self.count % self.size
+        self.samples['net_blocks'][slot] = sys.getallocatedblocks() - self.base_blocks
+        current, peak = tracemalloc.get_traced_memory()
+        self.samples['peak_bytes'][slot] = peak - self.base_bytes
+        self.samples['net_bytes'][slot] = current - self.base_bytes
+        self.samples['collections'][slot] = self.collections
+        self.count += 1
+
+    def summary(self, last=None):
+        # Averages per frame over the last frames (all that are still recorded by default)
+        n = min(last or self.size, self.count, self.size)
+        slots = [(self.count - n + i) % self.size for i in range(n)]
+        result = {field: sum(self.samples[field][s] for s in slots) / max(n, 1) for field in FIELDS}
+        result['frames'] = n
+        return result
+
+    def report(self):
+        s = self.summary()
+        return (f"allocations over {s['frames']} frames: {s['peak_bytes']:.0f} B peak, "
+                f"{s['net_bytes']:+.1f} B / {s['net_blocks']:+.2f} blocks net, "
+                f"{s['collections']:.3f} GC runs per frame")
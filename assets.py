@@ -0,0 +1,280 @@
+"""
+Asset caches for myTetris
+
+Backgrounds are decoded from JPEG and scaled to the window once per resolution. The scaled
+pixels are written as raw RGB to CACHE_DIR, keyed by source file, its mtime and size and
+the target resolution, so later launches and switches back to a resolution seen before
+memory-map them from disk instead of decoding and scaling again. Surfaces handed out are convert()ed to the display
+format, so per-frame blits take the fast path.
+
+BackgroundManager sits on top of the disk cache and keeps only the backgrounds the game is
+about to show in memory. AssetLoader and SoundBank load the rest of the startup assets on a
+thread pool behind show_loading_screen(); rarely used ones load in the background once the
+game is on screen, and a sound that is not ready yet is skipped rather than waited for.
+
+Sounds get the same treatment as backgrounds: PcmCache decodes each MP3 once, in the mixer's
+sample format, and later launches hand the memory-mapped samples straight to
+mixer.Sound(buffer=...).
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from audio import decode
+
+CACHE_DIR = '.cache'
+
+
+def _source_key(path):
+    stat = os.stat(path)
+    return f'{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def _display_ready():
+    return pygame.display.get_init() and pygame.display.get_surface() is not None
+
+
+# Disk side of the background cache; which surfaces stay in memory is up to BackgroundManager
+class BackgroundCache:
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = os.path.join(cache_dir, 'backgrounds')
+
+    def disk_path(self, path, size):
+        digest = hashlib.sha1(f'{_source_key(path)}:{size[0]}x{size[1]}'.encode()).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, f'{name}-{size[0]}x{size[1]}-{digest}.rgb')
+
+    def load(self, path, size, converted=False):
+        cached = self.disk_path(path, size)
+        if os.path.exists(cached) and os.path.getsize(cached) == size[0] * size[1] * 3:
+            with open(cached, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                view = pygame.image.frombuffer(data, size, 'RGB')
+                surface = view.convert() if converted else view.copy()
+                # release the buffer export before the mapping is closed
+                del view
+            return surface
+        surface = pygame.transform.scale(pygame.image.load(path), size)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f'{cached}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(pygame.image.tobytes(surface, 'RGB'))
+        os.replace(tmp, cached)
+        return surface.convert() if converted else surface
+
+
+# Decoded samples keyed by a hash of the source file's contents and the mixer format, so
+# replacing a sound file or changing the mixer settings decodes it again
+class PcmCache:
+    def __init__(self, cache_dir=CACHE_DIR, decoder=decode):
+        self.cache_dir = os.path.join(cache_dir, 'sound')
+        self.decoder = decoder
+
+    def disk_path(self, path):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read())
+        digest.update(repr(pygame.mixer.get_init()).encode())
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, f'{name}-{digest.hexdigest()[:16]}.pcm')
+
+    def samples(self, path):
+        # Read-only memory map of the raw samples of path, decoding them on a cache miss
+        cached = self.disk_path(path)
+        if not os.path.exists(cached):
+            raw = self.decoder(path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # threads may decode the same file at once, so the temporary name is per thread
+            tmp = f'{cached}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp, cached)
+        with open(cached, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def sound(self, path):
+        # Sound(buffer=...) copies the samples, so the mapping can go right away
+        with self.samples(path) as data:
+            return pygame.mixer.Sound(buffer=data)
+
+
+# Keeps only the current level's background resident, prefetches on a worker thread those
+# of the levels the next lock can reach (up to max_gain points, 4 lines ** 2 by default,
+# which may skip a level), and drops everything else. Surfaces come from
+# BackgroundCache.load, i.e. the disk cache.
+class BackgroundManager:
+    def __init__(self, paths, cache, max_gain=16):
+        self.paths = paths
+        self.cache = cache
+        self.max_gain = max_gain
+        self.size = None
+        self.resident = {}
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='background-prefetch')
+
+    def index(self, level):
+        return (level - 1) % len(self.paths)
+
+    def resize(self, size):
+        self.size = tuple(size)
+        self.resident.clear()
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+
+    def load(self, index, size):
+        return self.cache.load(self.paths[index], size, converted=_display_ready())
+
+    def prefetch(self, level):
+        index = self.index(level)
+        if index not in self.resident and index not in self.pending:
+            self.pending[index] = self.executor.submit(self.load, index, self.size)
+
+    def ready(self, level):
+        index = self.index(level)
+        return index in self.resident or (index in self.pending and self.pending[index].done())
+
+    def get(self, level):
+        index = self.index(level)
+        surface = self.resident.get(index)
+        if surface is None:
+            future = self.pending.pop(index, None)
+            surface = future.result() if future is not None else self.load(index, self.size)
+            self.resident[index] = surface
+        return surface
+
+    def update(self, score, level):
+        # Call once per frame: prefetch every level one lock can reach (level = score // 10 + 1),
+        # evict the rest
+        wanted = {self.index(level)}
+        for next_level in range(level + 1, (score + self.max_gain) // 10 + 2):
+            wanted.add(self.index(next_level))
+            self.prefetch(next_level)
+        for index in [i for i in self.resident if i not in wanted]:
+            del self.resident[index]
+        for index in [i for i in self.pending if i not in wanted]:
+            self.pending.pop(index).cancel()
+
+    def memory_usage(self):
+        # {path: bytes of pixel data} for every resident background
+        return {self.paths[i]: s.get_pitch() * s.get_height() for i, s in self.resident.items()}
+
+    def report(self):
+        usage = self.memory_usage()
+        lines = [f'{path}: {size / 2 ** 20:.1f} MB' for path, size in usage.items()]
+        lines.append(f'backgrounds resident: {len(usage)}/{len(self.paths)}, '
+                     f'{sum(usage.values()) / 2 ** 20:.1f} MB at {self.size[0]}x{self.size[1]}, '
+                     f'{len(self.pending)} prefetching')
+        return '\n'.join(lines)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Loads startup assets concurrently on a thread pool; assets registered with lazy() are only
+# loaded once load_lazy() or get() asks for them. Per-asset load times are kept for report().
+class AssetLoader:
+    def __init__(self, workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asset-loader')
+        self.futures = {}
+        self.lazy_loaders = {}
+        self.timings = {}
+
+    def _timed(self, name, load, *args):
+        start = time.perf_counter()
+        asset = load(*args)
+        self.timings[name] = time.perf_counter() - start
+        return asset
+
+    def submit(self, name, load, *args):
+        self.futures[name] = self.executor.submit(self._timed, name, load, *args)
+
+    def lazy(self, name, load, *args):
+        self.lazy_loaders[name] = (load, args)
+
+    def load_lazy(self, name=None):
+        # Start loading the lazy asset name, or every one of them, in the background
+        for lazy_name in list(self.lazy_loaders) if name is None else [name]:
+            if lazy_name in self.lazy_loaders:
+                load, args = self.lazy_loaders.pop(lazy_name)
+                self.submit(lazy_name, load, *args)
+
+    def get(self, name):
+        # The asset, waiting for it to load if it has not yet
+        self.load_lazy(name)
+        return self.futures[name].result()
+
+    def loaded(self, name):
+        future = self.futures.get(name)
+        return future is not None and future.done()
+
+    def progress(self):
+        # (finished, submitted); lazy assets count once they have been asked for
+        return sum(f.done() for f in self.futures.values()), len(self.futures)
+
+    def ready(self):
+        finished, total = self.progress()
+        return finished == total
+
+    def report(self):
+        return '\n'.join(f'{name}: {seconds * 1000:.1f} ms'
+                         for name, seconds in sorted(self.timings.items(), key=lambda t: -t[1]))
+
+
+# Sound effects by name, loaded from a PcmCache through an AssetLoader. get() never waits: a
+# sound still loading (a lazy one starts on first use) is None until it is ready. The volume
+# is remembered and applied to sounds that load later.
+class SoundBank:
+    def __init__(self, loader, paths, cache, lazy=()):
+        self.loader = loader
+        self.paths = paths
+        self.cache = cache
+        self.lazy_names = set(lazy)
+        self.volume = None
+        self.sounds = {}
+
+    def start(self):
+        for name, path in self.paths.items():
+            if name in self.lazy_names:
+                self.loader.lazy(f'sfx:{name}', self.cache.sound, path)
+            else:
+                self.loader.submit(f'sfx:{name}', self.cache.sound, path)
+
+    def get(self, name):
+        sound = self.sounds.get(name)
+        if sound is None:
+            key = f'sfx:{name}'
+            self.loader.load_lazy(key)
+            if not self.loader.loaded(key):
+                return None
+            sound = self.sounds[name] = self.loader.get(key)
+            if self.volume is not None:
+                sound.set_volume(self.volume)
+        return sound
+
+    def set_volume(self, volume):
+        self.volume = volume
+        for sound in self.sounds.values():
+            sound.set_volume(volume)
+
+
+def show_loading_screen(screen, loader, extra=lambda: True):
+    # Progress bar until every submitted asset is loaded and extra() is true
+    font = pygame.font.Font(None, max(screen.get_height() // 20, 12))
+    clock = pygame.time.Clock()
+    width, height = screen.get_size()
+    bar = pygame.Rect(width // 4, height // 2, width // 2, max(height // 40, 4))
+    while not (loader.ready() and extra()):
+        pygame.event.pump()
+        finished, total = loader.progress()
+        screen.fill((1, 1, 1))
+        text = font.render('Loading...', True, (255, 255, 255))
+        screen.blit(text, text.get_rect(midbottom=(width // 2, bar.top - bar.height)))
+        pygame.draw.rect(screen, (128, 128, 128), bar, 1)
+        pygame.draw.rect(screen, (255, 125, 0), (bar.x, bar.y, bar.width * finished // max(total, 1), bar.height))
+        pygame.display.flip()
+        clock.tick(30)
@@ -0,0 +1,274 @@
+"""
+Audio for myTetris
+
+MusicPlayer replaces mixer.music: tracks are decoded into memory on worker threads (the
+current song in both its normal and fast variant, plus the next song), and every switch
+crossfades between two reserved mixer channels without touching the disk on the game
+thread. Switching between the normal and fast variant of a song keeps the relative
+playback position; the worker builds a Sound rotated to start there, which loops
+seamlessly.
+
+SoundDispatcher plays sound effects on a pool of reserved channels of their own, so a burst
+of move/rotate clicks can never leave break_line or game_over without a free channel: every
+effect has a priority and a minimum interval between plays, and when the pool is full the
+oldest voice of the lowest priority not above the new one is stolen.
+
+Tracks come from an assets.PcmCache, so they are only decoded on the first launch. That
+decode happens in a child interpreter (run this module with a file name): mixer.Sound(path)
+holds SDL's audio lock while it decodes, which would stall every Channel.play() on the game
+thread for the whole decode. Building a Sound from an in-memory buffer does not.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+
+def decode(path):
+    # Raw PCM samples of path in the mixer's current format, decoded by a child process
+    frequency, size, channels = pygame.mixer.get_init()
+    env = dict(os.environ, SDL_AUDIODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1')
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), path, str(frequency), str(size),
+                             str(channels)], capture_output=True, check=True, env=env)
+    return result.stdout
+
+
+class MusicPlayer:
+    def __init__(self, tracks, fast_tracks, cache, crossfade_ms=400, channels=(0, 1)):
+        self.tracks = tracks
+        self.fast_tracks = fast_tracks
+        self.cache = cache
+        self.crossfade_ms = crossfade_ms
+        self.channel_ids = channels
+        self.channels = []
+        self.active = 0
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='music')
+        self.lock = threading.Lock()
+        self.decoded = {}
+        self.pending = None
+        self.current = None
+        self.sound = None
+        self.length = 0.0
+        self.offset = 0.0
+        self.started_at = 0.0
+        self.paused_at = None
+        self.volume = 1.0
+
+    def start(self):
+        # Call once the mixer is initialised; music channels are kept away from Sound.play()
+        pygame.mixer.set_reserved(max(self.channel_ids) + 1)
+        self.channels = [pygame.mixer.Channel(i) for i in self.channel_ids]
+
+    def path(self, index, fast=False):
+        tracks = self.fast_tracks if fast else self.tracks
+        return tracks[index % len(tracks)]
+
+    def _decode(self, path):
+        # Runs on a worker: (Sound, memory-mapped samples), loaded once and kept until evicted
+        with self.lock:
+            entry = self.decoded.get(path)
+        if entry is None:
+            raw = self.cache.samples(path)
+            entry = (pygame.mixer.Sound(buffer=raw), raw)
+            with self.lock:
+                self.decoded[path] = entry
+        return entry
+
+    def preload(self, index):
+        for fast in (False, True):
+            self.executor.submit(self._decode, self.path(index, fast))
+
+    def ready(self, index, fast=False):
+        with self.lock:
+            return self.path(index, fast) in self.decoded
+
+    def _prepare(self, path, position):
+        # Runs on a worker: a Sound that starts at the fraction position() of the track and loops
+        sound, raw = self._decode(path)
+        length = sound.get_length()
+        if position is None:
+            return path, sound, 0.0, length
+        frequency, size, channels = pygame.mixer.get_init()
+        frame = abs(size) // 8 * channels
+        cut = int(len(raw) * (position() % 1.0)) // frame * frame
+        if not cut:
+            return path, sound, 0.0, length
+        rotated = pygame.mixer.Sound(buffer=raw[cut:] + raw[:cut])
+        return path, rotated, cut / frame / frequency, length
+
+    def position(self):
+        # Fraction of the current track played so far
+        if self.current is None or not self.length:
+            return 0.0
+        now = self.paused_at if self.paused_at is not None else time.perf_counter()
+        return (self.offset + now - self.started_at) / self.length
+
+    def play(self, index, fast=False, restart=False):
+        # restart: start over from the beginning and unpaused, even if index is playing
+        if restart:
+            self.stop()
+            self.paused_at = None
+        index %= len(self.tracks)
+        same_song = self.current is not None and self.current[0] == index
+        if self.current == (index, fast):
+            return
+        self.current = (index, fast)
+        # the worker reads the position when the new Sound is built, so it stays in sync
+        self.pending = self.executor.submit(self._prepare, self.path(index, fast),
+                                            self.position if same_song else None)
+        self.preload(index)
+        self.preload(index + 1)
+        wanted = {self.path(i, f) for i in (index, index + 1) for f in (False, True)}
+        with self.lock:
+            for path in [p for p in self.decoded if p not in wanted]:
+                del self.decoded[path]
+
+    def update(self):
+        # Call once per frame; starts a prepared track without ever waiting for one
+        if self.pending is None or not self.pending.done():
+            return
+        path, sound, offset, length = self.pending.result()
+        self.pending = None
+        if self.current is None or path != self.path(*self.current):
+            return
+        old = self.channels[self.active]
+        self.active = 1 - self.active
+        new = self.channels[self.active]
+        fade_ms = 0
+        if old.get_busy():
+            old.fadeout(self.crossfade_ms)
+            fade_ms = self.crossfade_ms
+        sound.set_volume(self.volume)
+        new.play(sound, loops=-1, fade_ms=fade_ms)
+        if self.paused_at is not None:
+            new.pause()
+        self.sound = sound
+        self.length = length
+        self.offset = offset
+        self.started_at = self.paused_at if self.paused_at is not None else time.perf_counter()
+
+    def pause(self):
+        if self.paused_at is None:
+            self.paused_at = time.perf_counter()
+            for channel in self.channels:
+                channel.pause()
+
+    def unpause(self):
+        if self.paused_at is not None:
+            self.started_at += time.perf_counter() - self.paused_at
+            self.paused_at = None
+            for channel in self.channels:
+                channel.unpause()
+
+    def stop(self):
+        self.current = None
+        self.pending = None
+        self.sound = None
+        for channel in self.channels:
+            channel.stop()
+
+    def set_volume(self, volume):
+        self.volume = volume
+        if self.sound is not None:
+            self.sound.set_volume(volume)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Effect names are looked up in a SoundBank (or any mapping of name -> Sound); one that is not
+# loaded yet is skipped rather than waited for. A play() given the time of what triggered it
+# (the key press, the tick, on clock()) is timed from then to the return of Channel.play();
+# report() adds the mixer's buffer length, which is how long the sound can still wait before
+# it reaches the device.
+class SoundDispatcher:
+    def __init__(self, bank, priorities, min_intervals, channels=range(2, 8), buffer_size=None,
+                 clock=time.perf_counter):
+        self.bank = bank
+        self.clock = clock
+        self.priorities = priorities
+        self.min_intervals = min_intervals
+        self.channel_ids = tuple(channels)
+        # the size given to pygame.mixer.pre_init(); SDL_mixer has no getter for it
+        self.buffer_size = buffer_size
+        self.channels = []
+        # per channel: (priority, start time, name) of the voice last started on it
+        self.voices = {}
+        self.last_played = {}
+        self.counts = {'played': 0, 'stolen': 0, 'rate_limited': 0, 'rejected': 0, 'not_loaded': 0}
+        self.latencies = []
+
+    def start(self):
+        # Call after MusicPlayer.start(): reserves every channel up to the end of the pool
+        pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), max(self.channel_ids) + 1))
+        pygame.mixer.set_reserved(max(self.channel_ids) + 1)
+        self.channels = [pygame.mixer.Channel(i) for i in self.channel_ids]
+
+    def _channel(self, priority):
+        # A free channel, else the one whose voice is cheapest to cut off, else None
+        victim = None
+        for channel in self.channels:
+            if not channel.get_busy():
+                return channel
+            voice = self.voices.get(channel)
+            if voice is not None and voice[0] <= priority and (victim is None or voice < self.voices[victim]):
+                victim = channel
+        if victim is not None:
+            self.counts['stolen'] += 1
+        return victim
+
+    def play(self, name, trigger=None):
+        # trigger: clock() time of the input or tick that caused the sound, None if unknown
+        now = self.clock()
+        if now - self.last_played.get(name, float('-inf')) < self.min_intervals.get(name, 0.0):
+            self.counts['rate_limited'] += 1
+            return None
+        sound = self.bank.get(name)
+        if sound is None:
+            self.counts['not_loaded'] += 1
+            return None
+        priority = self.priorities.get(name, 0)
+        channel = self._channel(priority)
+        if channel is None:
+            self.counts['rejected'] += 1
+            return None
+        channel.play(sound)
+        self.voices[channel] = (priority, now, name)
+        self.last_played[name] = now
+        self.counts['played'] += 1
+        if trigger is not None:
+            self.latencies.append(self.clock() - trigger)
+        return channel
+
+    def stop(self):
+        for channel in self.channels:
+            channel.stop()
+        self.voices.clear()
+
+    def buffer_latency(self):
+        # Seconds of audio in one mixer buffer, i.e. the device-side part of the latency
+        init = pygame.mixer.get_init()
+        if init is None or not self.buffer_size:
+            return 0.0
+        return self.buffer_size / init[0]
+
+    def report(self):
+        lines = [', '.join(f'{k}: {v}' for k, v in self.counts.items())]
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            p50 = ordered[len(ordered) // 2] * 1000
+            p99 = ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] * 1000
+            lines.append(f'sfx trigger-to-playback latency: p50 {p50:.2f} ms, p99 {p99:.2f} ms, '
+                         f'+ {self.buffer_latency() * 1000:.1f} ms mixer buffer')
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    source, mixer_frequency, mixer_size, mixer_channels = sys.argv[1:]
+    pygame.mixer.init(int(mixer_frequency), int(mixer_size), int(mixer_channels))
+    sys.stdout.buffer.write(pygame.mixer.Sound(source).get_raw())
@@ -0,0 +1,187 @@
+"""
+Batched myTetris simulator
+
+Steps N independent games per call for bot evaluation and training. The rules are
+those of engine.Tetris (same pieces, spawn, line clears, lines ** 2 scoring and
+level = score // 10 + 1), but all boards live in one (N, height, width) uint8 array
+and every move, collision test, lock and line clear is a NumPy operation over the
+whole batch.
+
+Finished games are left alone by step() until they are reset(), e.g.
+    rewards, done = sim.step(actions)
+    sim.reset(done)
+
+Run this module to compare its throughput against the scalar engine.
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+import engine
+from pieces import PIECES
+
+NOOP, LEFT, RIGHT, ROTATE, DOWN, DROP = range(6)
+ACTIONS = 6
+
+# CELLS[type, rotation] -> 4 x (dx, dy); missing rotations repeat the existing ones
+CELLS = np.array([[p.rotations[r % p.count].cells for r in range(4)] for p in PIECES], dtype=np.int64)
+ROTATIONS = np.array([p.count for p in PIECES], dtype=np.int64)
+
+
+class BatchTetris:
+    def __init__(self, n, width=10, height=20, seed=None):
+        self.n = n
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((n, height, width), dtype=np.uint8)
+        self.piece = np.zeros(n, dtype=np.int64)
+        self.next_piece = np.zeros(n, dtype=np.int64)
+        self.rotation = np.zeros(n, dtype=np.int64)
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.level = np.ones(n, dtype=np.int64)
+        self.pieces = np.zeros(n, dtype=np.int64)
+        self.done = np.zeros(n, dtype=bool)
+        self.reset()
+
+    def reset(self, mask=None):
+        idx = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        self.boards[idx] = 0
+        self.score[idx] = 0
+        self.level[idx] = 1
+        self.pieces[idx] = 0
+        self.done[idx] = False
+        self.next_piece[idx] = self.rng.integers(0, len(PIECES), size=idx.size)
+        self._spawn(idx)
+
+    def _spawn(self, idx):
+        self.piece[idx] = self.next_piece[idx]
+        self.next_piece[idx] = self.rng.integers(0, len(PIECES), size=idx.size)
+        self.rotation[idx] = 0
+        self.x[idx], self.y[idx] = PIECES[0].spawn(self.width)
+        self.done[idx] = self._collides(idx, self.rotation[idx], self.x[idx], self.y[idx])
+
+    def _cells(self, idx, rotation, x, y):
+        cells = CELLS[self.piece[idx], rotation]
+        return x[:, None] + cells[..., 0], y[:, None] + cells[..., 1]
+
+    def _collides(self, idx, rotation, x, y):
+        xs, ys = self._cells(idx, rotation, x, y)
+        outside = (xs < 0) | (xs >= self.width) | (ys >= self.height)
+        filled = self.boards[idx[:, None], ys.clip(0, self.height - 1), xs.clip(0, self.width - 1)] != 0
+        return (outside | (filled & (ys >= 0))).any(axis=1)
+
+    def _drop_y(self, idx):
+        y = self.y[idx].copy()
+        moving = np.arange(idx.size)
+        while moving.size:
+            sub = idx[moving]
+            blocked = self._collides(sub, self.rotation[sub], self.x[sub], y[moving] + 1)
+            moving = moving[~blocked]
+            y[moving] += 1
+        return y
+
+    def _lock(self, idx):
+        xs, ys = self._cells(idx, self.rotation[idx], self.x[idx], self.y[idx])
+        boards = self.boards[idx]
+        local = np.arange(idx.size)[:, None]
+        boards[local, ys, xs] = (self.piece[idx] + 1)[:, None]
+        full = boards.all(axis=2)
+        lines = full.sum(axis=1)
+        cleared = lines > 0
+        if cleared.any():
+            # stable sort puts full rows on top and keeps the rest in order, then blank them
+            order = np.argsort(~full[cleared], axis=1, kind='stable')
+            compacted = np.take_along_axis(boards[cleared], order[:, :, None], axis=1)
+            compacted[np.arange(self.height)[None, :] < lines[cleared][:, None]] = 0
+            boards[cleared] = compacted
+        self.boards[idx] = boards
+        rewards = lines ** 2
+        self.score[idx] += rewards
+        self.level[idx] = self.score[idx] // 10 + 1
+        self.pieces[idx] += 1
+        self._spawn(idx)
+        return rewards
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        live = ~self.done
+        rewards = np.zeros(self.n, dtype=np.int64)
+
+        idx = np.flatnonzero(live & ((actions == LEFT) | (actions == RIGHT)))
+        x = self.x[idx] + np.where(actions[idx] == LEFT, -1, 1)
+        ok = ~self._collides(idx, self.rotation[idx], x, self.y[idx])
+        self.x[idx[ok]] = x[ok]
+
+        idx = np.flatnonzero(live & (actions == ROTATE))
+        rotation = (self.rotation[idx] + 1) % ROTATIONS[self.piece[idx]]
+        ok = ~self._collides(idx, rotation, self.x[idx], self.y[idx])
+        self.rotation[idx[ok]] = rotation[ok]
+
+        idx = np.flatnonzero(live & (actions == DOWN))
+        blocked = self._collides(idx, self.rotation[idx], self.x[idx], self.y[idx] + 1)
+        self.y[idx[~blocked]] += 1
+        lock = idx[blocked]
+
+        idx = np.flatnonzero(live & (actions == DROP))
+        self.y[idx] = self._drop_y(idx)
+        lock = np.concatenate([lock, idx])
+
+        if lock.size:
+            rewards[lock] = self._lock(lock)
+        return rewards, self.done.copy()
+
+
+DIRECTIONS = [None, engine.Direction.LEFT, engine.Direction.RIGHT, engine.Direction.ROTATE,
+              engine.Direction.DOWN, engine.Direction.DROP]
+
+
+def benchmark_scalar(steps, seed=0):
+    rng = random.Random(seed)
+    game = engine.Tetris(width=10, height=20)
+    game.new_figure()
+    pieces = 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        if game.state != engine.GameState.RUNNING:
+            game = engine.Tetris(width=10, height=20)
+            game.new_figure()
+        direction = DIRECTIONS[rng.randrange(ACTIONS)]
+        if direction is not None:
+            figure = game.figure
+            game.move(direction)
+            pieces += game.figure is not figure
+    return steps / (time.perf_counter() - start), pieces
+
+
+def benchmark_batch(n, steps, seed=0):
+    sim = BatchTetris(n, seed=seed)
+    rng = np.random.default_rng(seed)
+    pieces = 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        before = sim.pieces.sum()
+        _, done = sim.step(rng.integers(0, ACTIONS, size=n))
+        pieces += sim.pieces.sum() - before
+        if done.any():
+            sim.reset(done)
+    return n * steps / (time.perf_counter() - start), pieces
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batched simulator throughput vs. the scalar engine')
+    parser.add_argument('-n', '--games', type=int, default=4096)
+    parser.add_argument('-s', '--steps', type=int, default=200)
+    args = parser.parse_args()
+
+    scalar_steps = args.games * args.steps // 10
+    scalar_rate, scalar_pieces = benchmark_scalar(scalar_steps)
+    batch_rate, batch_pieces = benchmark_batch(args.games, args.steps)
+    print(f'scalar Tetris: {scalar_rate:12,.0f} steps/s, {scalar_pieces} pieces locked')
+    print(f'BatchTetris:   {batch_rate:12,.0f} steps/s, {batch_pieces} pieces locked ({args.games} games)')
+    print(f'speed-up:      {batch_rate / scalar_rate:12.1f}x')
@@ -0,0 +1,260 @@
+"""
+Bitboard collision engine for myTetris
+
+Every play-field row is a single int whose bits are the occupied columns and every
+piece rotation is precomputed as up to 4 row masks (pieces.MASKS), so collision, drop
+and freeze boil down to a handful of shifts and ANDs instead of 16 list probes per cell.
+Rows carry PAD wall bits on both sides and the board has PAD solid rows below the
+floor, so walls and floor are just more set bits.
+
+BitBoard also keeps the column tops, row and column fill counts and holes up to date as
+pieces lock and rows clear; BoardFeatures is a read-only view of them. Run this module
+for a line clear micro-benchmark on tall boards.
+"""
+
+import argparse
+import random
+import time
+from bisect import bisect_right
+
+from pieces import BOTTOMS, MASKS
+
+PAD = 4
+
+
+class BitBoard:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.solid = (1 << (width + 2 * PAD)) - 1
+        self.full = ((1 << width) - 1) << PAD
+        self.wall = self.solid ^ self.full
+        self.rows = [self.wall] * height + [self.solid] * PAD
+        # highest filled row of every column, height for an empty column
+        self.tops = [height] * width
+        self.row_fill = [0] * height
+        # rows whose fill reached the width, waiting for clear_full_rows()
+        self.full_rows = set()
+        self.column_fill = [0] * width
+        self.filled_cells = 0
+        self.holes = 0
+        self.features = BoardFeatures(self)
+        self.masks = MASKS
+        self.bottoms = BOTTOMS
+
+    def collides(self, figure_type, rotation, x, y):
+        shift = x + PAD
+        if shift < 0:
+            return True
+        rows = self.rows
+        for dy, m in self.masks[figure_type][rotation]:
+            row = y + dy
+            if row >= 0 and rows[row] & (m << shift):
+                return True
+        return False
+
+    def drop_y(self, figure_type, rotation, x, y):
+        # A piece above the surface lands where its lowest cell in some column meets that
+        # column's top; only one tucked under an overhang is moved down row by row
+        landing = self.height
+        for dx, bottom in self.bottoms[figure_type][rotation]:
+            top = self.tops[x + dx]
+            if y + bottom >= top:
+                break
+            landing = min(landing, top - 1 - bottom)
+        else:
+            return landing
+        while not self.collides(figure_type, rotation, x, y + 1):
+            y += 1
+        return y
+
+    def column_holes(self, column):
+        return self.height - self.tops[column] - self.column_fill[column]
+
+    def place(self, figure_type, rotation, x, y):
+        shift = x + PAD
+        tops = self.tops
+        columns = range(x + self.bottoms[figure_type][rotation][0][0],
+                        x + self.bottoms[figure_type][rotation][-1][0] + 1)
+        self.holes -= sum(self.column_holes(column) for column in columns)
+        for dy, m in self.masks[figure_type][rotation]:
+            self.rows[y + dy] |= m << shift
+            cells = m.bit_count()
+            self.row_fill[y + dy] += cells
+            if self.row_fill[y + dy] == self.width:
+                self.full_rows.add(y + dy)
+            self.filled_cells += cells
+            for dx in range(4):
+                if m >> dx & 1:
+                    self.column_fill[x + dx] += 1
+                    if y + dy < tops[x + dx]:
+                        tops[x + dx] = y + dy
+        self.holes += sum(self.column_holes(column) for column in columns)
+
+    def clear_full_rows(self):
+        # Drop every full row at once and return their indices (top to bottom, as they were
+        # before the clear); every other row moves down by the number of full rows below it
+        height = self.height
+        width = self.width
+        row_fill = self.row_fill
+        full = sorted(self.full_rows)
+        self.full_rows.clear()
+        if not full:
+            return full
+        lines = len(full)
+        rows = self.rows
+        compact(rows, full, [self.wall] * lines)
+        compact(row_fill, full, [0] * lines)
+        self.filled_cells -= width * lines
+        column_fill = self.column_fill
+        tops = self.tops
+        for column, top in enumerate(tops):
+            column_fill[column] -= lines
+            above = bisect_right(full, top)
+            if above and full[above - 1] == top:
+                # its top cell was cleared, the next one down (if any) is the new top
+                bit = 1 << (column + PAD)
+                below = top + lines - above + 1
+                while below < height and not rows[below] & bit:
+                    below += 1
+                tops[column] = below
+            else:
+                tops[column] = top + lines - above
+        self.holes = sum(self.column_holes(column) for column in range(width))
+        return full
+
+    def rescan(self):
+        # Recompute the tops, fills and holes from the rows, for boards built row by row
+        height = self.height
+        self.row_fill[:] = [(row & self.full).bit_count() for row in self.rows[:height]]
+        self.full_rows = {row for row in range(height) if self.row_fill[row] == self.width}
+        for column in range(self.width):
+            bit = 1 << (column + PAD)
+            cells = [row for row in range(height) if self.rows[row] & bit]
+            self.column_fill[column] = len(cells)
+            self.tops[column] = cells[0] if cells else height
+        self.filled_cells = sum(self.row_fill)
+        self.holes = sum(self.column_holes(column) for column in range(self.width))
+
+
+# Read-only view of the features a BitBoard keeps up to date; every property is O(1) or
+# O(width), and the sequences are tuples, so nothing can change the board through it
+class BoardFeatures:
+    __slots__ = ('_board',)
+
+    def __init__(self, board):
+        self._board = board
+
+    @property
+    def heights(self):
+        # filled height of every column, counting from the floor
+        board = self._board
+        return tuple(board.height - top for top in board.tops)
+
+    @property
+    def max_height(self):
+        board = self._board
+        return board.height - min(board.tops)
+
+    @property
+    def row_fill(self):
+        return tuple(self._board.row_fill)
+
+    @property
+    def column_holes(self):
+        board = self._board
+        return tuple(board.column_holes(column) for column in range(board.width))
+
+    @property
+    def holes(self):
+        return self._board.holes
+
+    @property
+    def filled(self):
+        return self._board.filled_cells
+
+    @property
+    def bumpiness(self):
+        heights = self.heights
+        return sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+
+
+def compact(items, indices, blanks):
+    # Remove items[i] for the sorted indices from the list in place and put blanks (one for
+    # each) on top. Going down the indices, removing one leaves the next where it was, and
+    # del/insert only move references (a memmove) without touching the items themselves,
+    # which beats rebuilding the list even for several rows on a tall board
+    for index, blank in zip(indices, blanks):
+        del items[index]
+        items.insert(0, blank)
+
+
+def tall_board(width, height, lines, seed=0):
+    # The bottom half of a height-row board filled, with lines full rows spread through it
+    # and one gap in every other row
+    rng = random.Random(seed)
+    board = BitBoard(width, height)
+    stack = range(height - height // 2, height)
+    full = set(rng.sample(stack, lines))
+    for row in stack:
+        board.rows[row] = board.solid if row in full else board.solid ^ (1 << (rng.randrange(width) + PAD))
+    board.rescan()
+    return board
+
+
+def benchmark(width=10, heights=(20, 100, 1000, 10000), lines=(1, 4, 16), repeat=20):
+    for height in heights:
+        for count in lines:
+            if count > height // 2:
+                continue
+            results = []
+            for clear in (_clear_rows_one_by_one, BitBoard.clear_full_rows):
+                elapsed = 0
+                for seed in range(repeat):
+                    board = tall_board(width, height, count, seed)
+                    start = time.perf_counter_ns()
+                    clear(board)
+                    elapsed += time.perf_counter_ns() - start
+                results.append(elapsed / repeat / 1000)
+            print(f'height {height:6} lines {count:3}: row by row {results[0]:10.1f} us, '
+                  f'all at once {results[1]:10.1f} us ({results[0] / results[1]:5.1f}x)')
+
+
+def _clear_rows_one_by_one(board):
+    # The old line clear: every full row found and dropped on its own
+    cleared = []
+    for row in range(board.height):
+        if board.row_fill[row] != board.width:
+            continue
+        del board.rows[row]
+        board.rows.insert(0, board.wall)
+        del board.row_fill[row]
+        board.row_fill.insert(0, 0)
+        board.full_rows = {full + (full < row) for full in board.full_rows if full != row}
+        board.filled_cells -= board.width
+        for column in range(board.width):
+            board.column_fill[column] -= 1
+        tops = board.tops
+        for column, top in enumerate(tops):
+            if top < row:
+                tops[column] = top + 1
+            elif top == row:
+                # its top cell was cleared, the next one down (if any) is the new top
+                bit = 1 << (column + PAD)
+                below = row + 1
+                while below < board.height and not board.rows[below] & bit:
+                    below += 1
+                tops[column] = below
+        board.holes = sum(board.column_holes(column) for column in range(board.width))
+        cleared.append(row)
+    return cleared
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Line clear micro-benchmark on tall boards')
+    parser.add_argument('-w', '--width', type=int, default=10)
+    parser.add_argument('-r', '--repeat', type=int, default=20)
+    parser.add_argument('--heights', type=int, nargs='+', default=[20, 100, 1000, 10000])
+    parser.add_argument('--lines', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+    benchmark(args.width, args.heights, args.lines, args.repeat)
@@ -0,0 +1,110 @@
+"""
+Keyboard input for myTetris
+
+Events are stamped with the time they happened on the pygame.time.get_ticks() clock: SDL's
+own timestamp when pygame passes it on, otherwise the time they were polled. InputQueue.wait()
+keeps polling while the main loop waits for the next frame, so a stamp is never later than a
+couple of milliseconds, and the main loop applies every control in the simulation tick it
+belongs to instead of all at once when a frame starts.
+
+Holding LEFT or RIGHT moves once, then after DAS seconds repeats every ARR seconds (0 goes
+straight to the wall); holding DOWN switches gravity to the soft-drop speed.
+"""
+
+import pygame
+
+from engine import Direction
+
+SHIFTS = {pygame.K_LEFT: Direction.LEFT, pygame.K_RIGHT: Direction.RIGHT}
+ACTIONS = {pygame.K_UP: Direction.ROTATE, pygame.K_SPACE: Direction.DROP}
+SOFT_DROP_KEY = pygame.K_DOWN
+KEYS = set(SHIFTS) | set(ACTIONS) | {SOFT_DROP_KEY}
+
+
+def now():
+    return pygame.time.get_ticks() / 1000
+
+
+class InputQueue:
+    def __init__(self):
+        self.events = []
+
+    def poll(self):
+        polled = now()
+        for event in pygame.event.get():
+            stamp = getattr(event, 'timestamp', None)
+            self.events.append((polled if stamp is None else stamp / 1000, event))
+
+    def wait(self, until, interval=0.002):
+        # Sleep until the time until, polling every interval seconds
+        while True:
+            self.poll()
+            left = until - now()
+            if left <= 0:
+                return
+            pygame.time.wait(max(int(min(left, interval) * 1000), 1))
+
+    def take(self):
+        # Every (time, event) polled since the last take(), oldest first
+        events, self.events = self.events, []
+        events.sort(key=lambda stamped: stamped[0])
+        return events
+
+
+class Controls:
+    def __init__(self, das, arr, soft_drop_speed):
+        self.das = das
+        self.arr = arr
+        self.soft_drop_speed = soft_drop_speed
+        # horizontal directions held down, the one pressed last is the one that repeats
+        self.held = []
+        self.next_repeat = 0.0
+        self.soft_drop = False
+
+    def key_down(self, game, key, t):
+        # The Direction the key moved the piece in, None for soft drop
+        if key in SHIFTS:
+            direction = SHIFTS[key]
+            if direction in self.held:
+                self.held.remove(direction)
+            self.held.append(direction)
+            self.next_repeat = t + self.das
+            game.move(direction)
+            return direction
+        if key in ACTIONS:
+            game.move(ACTIONS[key])
+            return ACTIONS[key]
+        if key == SOFT_DROP_KEY:
+            self.soft_drop = True
+        return None
+
+    def key_up(self, key, t):
+        if key in SHIFTS and SHIFTS[key] in self.held:
+            repeating = self.held[-1] == SHIFTS[key]
+            self.held.remove(SHIFTS[key])
+            if repeating:
+                # a direction still held takes over, after its own DAS
+                self.next_repeat = t + self.das
+        elif key == SOFT_DROP_KEY:
+            self.soft_drop = False
+
+    def release_all(self):
+        self.held.clear()
+        self.soft_drop = False
+
+    def update(self, game, t):
+        # Auto-repeat the held direction up to time t; a blocked piece keeps its charge
+        # silently and moves again as soon as it can
+        if not self.held or game.figure is None:
+            return
+        direction = self.held[-1]
+        dx = -1 if direction == Direction.LEFT else 1
+        figure = game.figure
+        board = game.board
+        while self.next_repeat <= t and not board.collides(figure.type, figure.rotation, figure.x + dx, figure.y):
+            x = figure.x
+            game.move(direction)
+            if figure.x == x:
+                break
+            self.next_repeat += self.arr
+        self.next_repeat = max(self.next_repeat, t)
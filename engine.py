@@ -0,0 +1,216 @@
+"""
+Headless rules engine for myTetris
+
+No pygame in here: importing this module is cheap and works without a display or an
+audio device, so simulation workers can run thousands of games. Anything with a side
+effect (sounds, music) is published as a GameEvent to the listeners registered with
+Tetris.subscribe(); the pygame frontend in myTetris.py is just one such listener.
+"""
+
+import random
+from enum import Enum, auto
+
+from bitboard import BitBoard, compact
+from pieces import FIGURES, PIECES, PIECE_COLORS, Colors
+
+
+# noinspection PyArgumentList
+class Direction(Enum):
+    DOWN = auto()
+    LEFT = auto()
+    RIGHT = auto()
+    DROP = auto()
+    ROTATE = auto()
+
+
+# noinspection PyArgumentList
+class GameState(Enum):
+    RUNNING = auto()
+    GAME_OVER = auto()
+    PAUSE = auto()
+
+
+# noinspection PyArgumentList
+class GameEvent(Enum):
+    MOVE = auto()
+    ROTATE = auto()
+    NOPE = auto()
+    DROP = auto()
+    BREAK_LINE = auto()
+    LEVEL_UP = auto()
+    TROUBLE = auto()
+
+
+class Figure:
+    __slots__ = ('x', 'y', 'type', 'piece', 'color', 'rotation')
+
+    figures = FIGURES
+
+    def __init__(self):
+        self.set_position(0, 0)
+        self.type = random.randint(0, len(PIECES) - 1)
+        self.piece = PIECES[self.type]
+        self.color = random.choice(PIECE_COLORS)
+        self.rotation = 0
+
+    def image(self):
+        return self.piece.rotations[self.rotation].image
+
+    def shape(self):
+        return self.piece.rotations[self.rotation]
+
+    def rotate(self):
+        self.rotation = (self.rotation + 1) % self.piece.count
+
+    def set_position(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Tetris:
+    def __init__(self, width, height):
+        self.trouble = False
+        self.score = 0
+        self.state = GameState.RUNNING
+        self.height = height
+        self.width = width
+        self.field = [[Colors.WHITE] * width for _ in range(height)]
+        self.board = BitBoard(width, height)
+        # column heights, row fills, filled cells and holes, kept up to date by the board
+        self.features = self.board.features
+        self.field_size = width*height
+        self.field_full = 0
+        # bumped whenever the frozen cells change, so renderers know when to redraw them
+        self.field_version = 0
+        # rows the last break_lines() cleared, for line clear effects
+        self.cleared_rows = []
+        # gravity carried over between ticks, in cells (see fall())
+        self.fall_progress = 0.0
+        # find_ghost_y() result and the (figure, x, rotation, field_version) it is valid for
+        self.ghost_key = None
+        self.ghost_y = 0
+        self.figure = None
+        self.next_figure = Figure()
+        self.level = 1
+        self.game_over = False
+        self.listeners = []
+        # when the input or tick now being applied happened, on whatever clock the caller
+        # uses (None if it does not say), so listeners can tell how late they react
+        self.event_time = None
+
+    def subscribe(self, listener):
+        # listener(game, event) is called for every GameEvent this game emits
+        self.listeners.append(listener)
+
+    def emit(self, event: GameEvent):
+        for listener in self.listeners:
+            listener(self, event)
+
+    def new_figure(self):
+        self.figure = self.next_figure
+        self.figure.set_position(*self.figure.piece.spawn(self.width))
+        self.next_figure = Figure()
+
+    def move(self, direction: Direction):
+        if self.state != GameState.RUNNING:
+            return
+        match direction:
+            case Direction.DOWN:
+                self.go_down()
+            case Direction.DROP:
+                self.go_drop()
+            case Direction.ROTATE:
+                self.rotate()
+            case Direction.LEFT:
+                self.go_side(-1)
+            case Direction.RIGHT:
+                self.go_side(1)
+
+    def fall(self, cells):
+        # Gravity for one tick: cells may be a fraction of a row or several rows at once
+        if self.state != GameState.RUNNING or self.figure is None:
+            return
+        self.fall_progress += cells
+        while self.fall_progress >= 1:
+            self.fall_progress -= 1
+            figure = self.figure
+            self.go_down()
+            if self.figure is not figure or self.intersects(self.figure.y + 1):
+                # locked, and the next piece starts from rest; or landed, and it takes
+                # another full cell of gravity to lock, even at 20G
+                self.fall_progress = 0.0
+                break
+
+    def go_side(self, dx):
+        old_x = self.figure.x
+        self.figure.x += dx
+        if self.intersects():
+            self.emit(GameEvent.NOPE)
+            self.figure.x = old_x
+        else:
+            self.emit(GameEvent.MOVE)
+
+    def go_down(self):
+        self.figure.y += 1
+        if self.intersects():
+            self.figure.y -= 1
+            self.freeze()
+
+    def rotate(self):
+        old_rotation = self.figure.rotation
+        self.figure.rotate()
+        if self.intersects():
+            self.emit(GameEvent.NOPE)
+            self.figure.rotation = old_rotation
+        else:
+            self.emit(GameEvent.ROTATE)
+
+    def go_drop(self):
+        self.figure.y = self.find_ghost_y()
+        self.freeze()
+
+    def find_ghost_y(self):
+        # Falling straight down does not change where the piece lands, so the landing row
+        # only needs recomputing after a sideways move, a rotation or a field change
+        figure = self.figure
+        key = (figure, figure.x, figure.rotation, self.field_version)
+        if key != self.ghost_key or figure.y > self.ghost_y:
+            self.ghost_key = key
+            self.ghost_y = self.board.drop_y(figure.type, figure.rotation, figure.x, figure.y)
+        return self.ghost_y
+
+    def intersects(self, figure_y=None):
+        if figure_y is None:
+            figure_y = self.figure.y
+        return self.board.collides(self.figure.type, self.figure.rotation, self.figure.x, figure_y)
+
+    def freeze(self):
+        self.emit(GameEvent.DROP)
+        for dx, dy in self.figure.shape().cells:
+            self.field[dy + self.figure.y][dx + self.figure.x] = self.figure.color
+        self.board.place(self.figure.type, self.figure.rotation, self.figure.x, self.figure.y)
+        self.break_lines()
+        self.field_version += 1
+        self.new_figure()
+        if self.intersects():
+            self.state = GameState.GAME_OVER
+        self.field_full = self.features.filled
+        trouble = self.field_full > self.field_size // 2
+        if trouble != self.trouble:
+            self.trouble = trouble
+            self.emit(GameEvent.TROUBLE)
+
+    def break_lines(self):
+        # Clears every full row at once and returns their indices, top to bottom as they
+        # were before the clear; BREAK_LINE listeners find them in cleared_rows
+        cleared = self.cleared_rows = self.board.clear_full_rows()
+        compact(self.field, cleared, [[Colors.WHITE] * self.width for _ in cleared])
+        for _ in cleared:
+            self.emit(GameEvent.BREAK_LINE)
+        lines = len(cleared)
+        self.score += lines ** 2
+        current_level = self.level
+        self.level = self.score // 10 + 1
+        if self.level != current_level:
+            self.emit(GameEvent.LEVEL_UP)
+        return cleared
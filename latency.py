@@ -0,0 +1,57 @@
+"""
+Input-to-photon latency for myTetris
+
+LatencyProbe follows every control key press that changed the game from the time it
+happened to the end of the first frame that draws the change, and to the return of the
+pygame.display.flip()/update() that shows it, then writes p50/p95/p99 of both per action
+to a CSV. Times are seconds on the pygame.time.get_ticks() clock, the one the
+controls.InputQueue stamps are on.
+"""
+
+import csv
+from collections import defaultdict
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of a non-empty list
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, -(-len(ordered) * q // 100) - 1))]
+
+
+class LatencyProbe:
+    def __init__(self, path):
+        self.path = path
+        # [action, pressed, drawn] of presses not on screen yet
+        self.pending = []
+        # action -> [(press to drawn, press to presented)]
+        self.samples = defaultdict(list)
+
+    def handled(self, action, pressed):
+        self.pending.append([action, pressed, None])
+
+    def drawn(self, t):
+        for entry in self.pending:
+            if entry[2] is None:
+                entry[2] = t
+
+    def presented(self, t):
+        for action, pressed, drawn in self.pending:
+            self.samples[action].append((drawn - pressed, t - pressed))
+        self.pending.clear()
+
+    def rows(self):
+        for action, samples in sorted(self.samples.items(), key=lambda item: item[0].name):
+            row = [action.name, len(samples)]
+            for column in (0, 1):
+                values = [sample[column] for sample in samples]
+                row += [f'{percentile(values, q) * 1000:.1f}' for q in PERCENTILES]
+            yield row
+
+    def export(self):
+        with open(self.path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['action', 'samples']
+                            + [f'{stage}_p{q}_ms' for stage in ('drawn', 'presented') for q in PERCENTILES])
+            writer.writerows(self.rows())
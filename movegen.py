@@ -0,0 +1,205 @@
+"""
+Reachable-placement move generator for myTetris
+
+Finds every distinct lock position the current piece can reach through the real
+go_side / rotate / go_down rules of engine.Tetris, including slides and tucks under
+overhangs, not just straight drops. It is a BFS over (x, y, rotation) states with a
+per-row visited bitset; states where the piece cannot move down are lock positions.
+Lock positions that cover the same cells are reported once, which folds symmetric
+rotations together.
+
+Results are memoized per (board, piece, start state). Run this module for a
+perft-style benchmark on fixed board fixtures.
+"""
+
+import argparse
+import time
+from collections import deque
+from functools import lru_cache
+
+from bitboard import PAD
+from engine import Direction
+from pieces import PIECES
+
+CACHE_SIZE = 1 << 12
+
+FIXTURES = {
+    'empty': [],
+    'ragged': [
+        '#.........',
+        '##...#...#',
+        '###.##..##',
+        '####.#.###',
+        '#########.',
+    ],
+    'overhangs': [
+        '...###....',
+        '...#......',
+        '...#...###',
+        '.......#..',
+        '#.#....#.#',
+        '##.#..####',
+    ],
+    'well': [
+        '#########.',
+        '####.####.',
+        '#########.',
+        '##.######.',
+        '#########.',
+        '#########.',
+        '#.#######.',
+        '#########.',
+    ],
+}
+
+
+def rows_from_strings(lines, width=10, height=20):
+    # Bitboard rows (walls and floor included) for a board drawn bottom-aligned with '#' cells
+    solid = (1 << (width + 2 * PAD)) - 1
+    wall = solid ^ (((1 << width) - 1) << PAD)
+    rows = [wall] * height + [solid] * PAD
+    for i, line in enumerate(lines):
+        row = wall
+        for j, c in enumerate(line):
+            if c == '#':
+                row |= 1 << (j + PAD)
+        rows[height - len(lines) + i] = row
+    return tuple(rows)
+
+
+def _collides(rows, masks, x, y):
+    shift = x + PAD
+    if shift < 0:
+        return True
+    for dy, m in masks:
+        row = y + dy
+        if row >= 0 and rows[row] & (m << shift):
+            return True
+    return False
+
+
+def _neighbours(rows, piece, x, y, rotation):
+    # (Direction, state) for every move that engine.Tetris would accept, except locking
+    masks = piece.rotations[rotation].masks
+    if not _collides(rows, masks, x - 1, y):
+        yield Direction.LEFT, (x - 1, y, rotation)
+    if not _collides(rows, masks, x + 1, y):
+        yield Direction.RIGHT, (x + 1, y, rotation)
+    turned = (rotation + 1) % piece.count
+    if turned != rotation and not _collides(rows, piece.rotations[turned].masks, x, y):
+        yield Direction.ROTATE, (x, y, turned)
+    if not _collides(rows, masks, x, y + 1):
+        yield Direction.DOWN, (x, y + 1, rotation)
+
+
+def search(rows, figure_type, x, y, rotation):
+    # Uncached BFS: ((rotation, x, y), ...) lock positions in discovery order plus nodes visited
+    piece = PIECES[figure_type]
+    if _collides(rows, piece.rotations[rotation].masks, x, y):
+        return (), 0
+    visited = [[0] * len(rows) for _ in range(piece.count)]
+    visited[rotation][y] |= 1 << (x + PAD)
+    queue = deque([(x, y, rotation)])
+    footprints = set()
+    locks = []
+    nodes = 0
+    while queue:
+        x, y, rotation = queue.popleft()
+        nodes += 1
+        masks = piece.rotations[rotation].masks
+        if _collides(rows, masks, x, y + 1):
+            footprint = tuple((y + dy, m << (x + PAD)) for dy, m in masks)
+            if footprint not in footprints:
+                footprints.add(footprint)
+                locks.append((rotation, x, y))
+        for _, (nx, ny, nr) in _neighbours(rows, piece, x, y, rotation):
+            bit = 1 << (nx + PAD)
+            if not visited[nr][ny] & bit:
+                visited[nr][ny] |= bit
+                queue.append((nx, ny, nr))
+    return tuple(locks), nodes
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def generate(rows, figure_type, x, y, rotation):
+    return search(rows, figure_type, x, y, rotation)[0]
+
+
+def placements(game):
+    # Every distinct reachable lock position (rotation, x, y) of game.figure
+    figure = game.figure
+    return generate(tuple(game.board.rows), figure.type, figure.x, figure.y, figure.rotation)
+
+
+def find_path(rows, figure_type, start, target):
+    # Shortest list of Directions from start to target, both (rotation, x, y), or None
+    piece = PIECES[figure_type]
+    rotation, x, y = start
+    parents = {(x, y, rotation): None}
+    queue = deque([(x, y, rotation)])
+    goal = (target[1], target[2], target[0])
+    while queue:
+        state = queue.popleft()
+        if state == goal:
+            path = []
+            while parents[state] is not None:
+                state, direction = parents[state]
+                path.append(direction)
+            return path[::-1]
+        for direction, nxt in _neighbours(rows, piece, *state):
+            if nxt not in parents:
+                parents[nxt] = (state, direction)
+                queue.append(nxt)
+    return None
+
+
+def _lock(rows, figure_type, rotation, x, y, width, height):
+    rows = list(rows)
+    for dy, m in PIECES[figure_type].rotations[rotation].masks:
+        rows[y + dy] |= m << (x + PAD)
+    solid = rows[height]
+    kept = [r for r in rows[:height] if r != solid]
+    wall = solid ^ (((1 << width) - 1) << PAD)
+    return tuple([wall] * (height - len(kept)) + kept + rows[height:])
+
+
+def perft(rows, sequence, width=10, height=20):
+    # (leaf placements, BFS nodes) for placing every piece of sequence in turn
+    if not sequence:
+        return 1, 0
+    figure_type = sequence[0]
+    x, y = PIECES[figure_type].spawn(width)
+    locks, nodes = search(rows, figure_type, x, y, 0)
+    if len(sequence) == 1:
+        return len(locks), nodes
+    leaves = 0
+    for rotation, lx, ly in locks:
+        sub_leaves, sub_nodes = perft(_lock(rows, figure_type, rotation, lx, ly, width, height), sequence[1:],
+                                      width, height)
+        leaves += sub_leaves
+        nodes += sub_nodes
+    return leaves, nodes
+
+
+def benchmark(depth=2):
+    total_nodes = 0
+    total_time = 0.0
+    for name, lines in FIXTURES.items():
+        rows = rows_from_strings(lines)
+        for figure_type in range(len(PIECES)):
+            sequence = [(figure_type + i) % len(PIECES) for i in range(depth)]
+            start = time.perf_counter()
+            leaves, nodes = perft(rows, sequence)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            print(f'{name:10} pieces {sequence}: {leaves:8,} leaves {nodes:10,} nodes '
+                  f'{nodes / elapsed:12,.0f} nodes/s')
+    print(f'total: {total_nodes:,} nodes in {total_time:.2f}s, {total_nodes / total_time:,.0f} nodes/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Perft-style move generator benchmark')
+    parser.add_argument('-d', '--depth', type=int, default=2)
+    args = parser.parse_args()
+    benchmark(args.depth)
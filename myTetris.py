@@ -12,209 +12,37 @@ TODO:
 * Animate line break
 """
 
-import random
-from enum import Enum, auto
+import time
 from typing import Tuple
 
+# cold-start reference for the time-to-first-frame report
+START = time.perf_counter()
+
 import pygame
-from pygame import mixer
 import pygame_menu
 
-
-class Colors(Enum):
-    BLACK = (1, 1, 1)
-    WHITE = (255, 255, 255, 220)
-    GRAY = (128, 128, 128)
-    COLOR_1 = (120, 37, 179)
-    COLOR_2 = (100, 179, 179)
-    COLOR_3 = (80, 34, 22)
-    COLOR_4 = (80, 134, 22)
-    COLOR_5 = (180, 34, 22)
-    COLOR_6 = (180, 34, 122)
-    COLOR_7 = (255, 125, 0)
-
-
-# noinspection PyArgumentList
-class Direction(Enum):
-    DOWN = auto()
-    LEFT = auto()
-    RIGHT = auto()
-    DROP = auto()
-    ROTATE = auto()
-
-
-# noinspection PyArgumentList
-class GameState(Enum):
-    RUNNING = auto()
-    GAME_OVER = auto()
-    PAUSE = auto()
-
-
-class Figure:
-    x = 0
-    y = 0
-
-    figures = [
-        [[1, 5, 9, 13], [4, 5, 6, 7]],
-        [[4, 5, 9, 10], [2, 6, 5, 9]],
-        [[6, 7, 9, 10], [1, 5, 6, 10]],
-        [[1, 2, 5, 9], [0, 4, 5, 6], [1, 5, 9, 8], [4, 5, 6, 10]],
-        [[1, 2, 6, 10], [5, 6, 7, 9], [2, 6, 10, 11], [3, 5, 6, 7]],
-        [[1, 4, 5, 6], [1, 4, 5, 9], [4, 5, 6, 9], [1, 5, 6, 9]],
-        [[1, 2, 5, 6]],
-    ]
-
-    def __init__(self):
-        self.set_position(0, 0)
-        self.type = random.randint(0, len(self.figures) - 1)
-        self.color = random.choice([i for i in Colors if i not in [Colors.WHITE, Colors.GRAY]])
-        self.rotation = 0
-
-    def image(self):
-        return self.figures[self.type][self.rotation]
-
-    def rotate(self):
-        self.rotation = (self.rotation + 1) % len(self.figures[self.type])
-
-    def set_position(self, x, y):
-        self.x = x
-        self.y = y
-
-
-class Tetris:
+import ai
+from allocations import AllocationCounter
+from assets import AssetLoader, BackgroundCache, BackgroundManager, PcmCache, SoundBank, show_loading_screen
+from audio import MusicPlayer, SoundDispatcher
+from controls import KEYS, Controls, InputQueue, now as input_time
+import engine
+from engine import GameEvent, GameState
+from latency import LatencyProbe
+from pieces import Colors
+from profiler import FrameProfiler
+from render import BoardLayer, DirtyTracker, TextCache
+from slowframes import FrameWatchdog
+from timing import TICK_RATE, FixedStep, gravity
+
+
+class Tetris(engine.Tetris):
     x = 0
     y = 0
 
     def __init__(self, width, height):
-        self.trouble = False
-        self.block_size = int(SCREEN_WIDTH * 0.02)
-        self.score = 0
-        self.state = GameState.RUNNING
-        self.height = height
-        self.width = width
-        self.field = [[Colors.WHITE] * width for _ in range(height)]
-        self.field_size = width*height
-        self.field_full = 0
-        self.figure = None
-        self.next_figure = Figure()
-        self.level = 1
-        # set play-field to middle of screen horizontally
-        self.x = SCREEN_WIDTH // 2 - (self.width // 2 * self.block_size)
-        # set play-field to bottom + 3 rows vertically
-        self.y = int(SCREEN_HEIGHT - (self.height * self.block_size) - self.block_size * 3)
-        self.game_over = False
-
-    def new_figure(self):
-        self.figure = self.next_figure
-        self.figure.set_position(self.width // 2 - 2, 0)
-        self.next_figure = Figure()
-
-    def move(self, direction: Direction):
-        if self.state != GameState.RUNNING:
-            return
-        match direction:
-            case Direction.DOWN:
-                self.go_down()
-            case Direction.DROP:
-                self.go_drop()
-            case Direction.ROTATE:
-                self.rotate()
-            case Direction.LEFT:
-                self.go_side(-1)
-            case Direction.RIGHT:
-                self.go_side(1)
-
-    def go_side(self, dx):
-        old_x = self.figure.x
-        self.figure.x += dx
-        if self.intersects():
-            sfx['nope'].play()
-            self.figure.x = old_x
-        else:
-            sfx['move'].play()
-
-    def go_down(self):
-        self.figure.y += 1
-        if self.intersects():
-            self.figure.y -= 1
-            self.freeze()
-
-    def rotate(self):
-        old_rotation = self.figure.rotation
-        self.figure.rotate()
-        if self.intersects():
-            sfx['nope'].play()
-            self.figure.rotation = old_rotation
-        else:
-            sfx['rotate'].play()
-
-    def go_drop(self):
-        while not self.intersects():
-            self.figure.y += 1
-        self.figure.y -= 1
-        self.freeze()
-
-    def find_ghost_y(self):
-        ghost_y = self.figure.y
-        while not self.intersects(ghost_y):
-            ghost_y += 1
-        return ghost_y - 1
-
-    def intersects(self, figure_y=None):
-        if not figure_y:
-            figure_y = self.figure.y
-        intersection = False
-        for i in range(4):
-            for j in range(4):
-                if i * 4 + j in self.figure.image():
-                    if i + figure_y > self.height - 1 or \
-                            j + self.figure.x > self.width - 1 or \
-                            j + self.figure.x < 0 or \
-                            self.field[i + figure_y][j + self.figure.x] != Colors.WHITE:
-                        intersection = True
-        return intersection
-
-    def freeze(self):
-        sfx['drop'].play()
-        for i in range(4):
-            for j in range(4):
-                if i * 4 + j in self.figure.image():
-                    self.field[i + self.figure.y][j + self.figure.x] = self.figure.color
-        self.break_lines()
-        self.new_figure()
-        if self.intersects():
-            self.state = GameState.GAME_OVER
-        self.field_full = self.field_size - sum(x.count(Colors.WHITE) for x in self.field)
-        if self.field_full > self.field_size // 2:
-            if not self.trouble:
-                self.trouble = True
-                mixer.music.load(fast_music[current_music])
-                mixer.music.play(-1)
-        else:
-            if self.trouble:
-                self.trouble = False
-                mixer.music.load(music[current_music])
-                mixer.music.play(-1)
-
-    def break_lines(self):
-        lines = 0
-        for i in range(1, self.height):
-            if Colors.WHITE not in self.field[i]:
-                sfx['break_line'].play()
-                lines += 1
-                for i1 in range(i, 1, -1):
-                    self.field[i1] = self.field[i1 - 1].copy()
-        self.score += lines ** 2
-        current_level = self.level
-        self.level = self.score // 10 + 1
-        if self.level != current_level:
-            global current_music
-            current_music += 1
-            if self.trouble:
-                mixer.music.load(fast_music[current_music % len(music)])
-            else:
-                mixer.music.load(music[current_music % len(music)])
-            mixer.music.play(loops=-1)
+        super().__init__(width, height)
+        self.resize()
 
     def resize(self):
         self.block_size = int(SCREEN_WIDTH * 0.02)
@@ -222,12 +50,56 @@ class Tetris:
         self.x = SCREEN_WIDTH // 2 - (self.width // 2 * self.block_size)
         # set play-field to bottom + 3 rows vertically
         self.y = int(SCREEN_HEIGHT - (self.height * self.block_size) - self.block_size * 3)
+        self.play_field_rect = pygame.Rect(self.x - 1, self.y, self.block_size * self.width + 2,
+                                           self.block_size * self.height + 2)
+        self.next_rect = pygame.Rect(self.x - self.block_size * 10, self.y, self.block_size * 6, self.block_size * 6)
+
+    def figure_rect(self, figure, y, offset=0):
+        # Screen area covered by figure's cells with its top-left at (figure.x, y), offset pixels lower
+        shape = figure.shape()
+        return pygame.Rect(self.x + self.block_size * (figure.x + shape.left) + 1,
+                           self.y + self.block_size * (y + shape.top) + 1 + offset,
+                           self.block_size * (shape.right - shape.left + 1),
+                           self.block_size * (shape.bottom - shape.top + 1))
+
+
+def play_music(trouble):
+    music_player.play(current_music, fast=trouble)
+
+
+def on_game_event(game, event):
+    global current_music
+    match event:
+        case GameEvent.MOVE:
+            effects.play('move', game.event_time)
+        case GameEvent.ROTATE:
+            effects.play('rotate', game.event_time)
+        case GameEvent.NOPE:
+            effects.play('nope', game.event_time)
+        case GameEvent.DROP:
+            effects.play('drop', game.event_time)
+        case GameEvent.BREAK_LINE:
+            effects.play('break_line', game.event_time)
+        case GameEvent.LEVEL_UP:
+            current_music += 1
+            play_music(game.trouble)
+        case GameEvent.TROUBLE:
+            play_music(game.trouble)
 
 
 def new_game():
-    mixer.music.load(music[0])
-    mixer.music.play(loops=-1)
-    return Tetris(width=10, height=20)
+    music_player.play(0, restart=True)
+    game = Tetris(width=10, height=20)
+    game.subscribe(on_game_event)
+    return game
+
+
+def prepare_alpha_surface(game):
+    # Semi-transparent tint behind the play-field and the next piece box
+    surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+    pygame.draw.rect(surface, Colors.WHITE.value, game.play_field_rect)
+    pygame.draw.rect(surface, Colors.WHITE.value, game.next_rect)
+    return surface
 
 
 def text_drop_shadow(font, message, offset, fontcolor, shadowcolor):
@@ -241,15 +113,24 @@ def text_drop_shadow(font, message, offset, fontcolor, shadowcolor):
     return img
 
 
+def cached_drop_shadow(font, message, offset, fontcolor, shadowcolor):
+    return text_cache.get(('shadow', font, message, offset, tuple(fontcolor), tuple(shadowcolor)),
+                          text_drop_shadow, font, message, offset, fontcolor, shadowcolor)
+
+
+def cached_render(font, message, fontcolor, background):
+    return text_cache.get(('render', font, message, tuple(fontcolor), tuple(background)),
+                          font.render, message, True, fontcolor, background)
+
+
 def main():
     def set_music_volume(value):
-        pygame.mixer.music.set_volume(value / 10)
+        music_player.set_volume(value / 10)
 
     def set_sfx_volume(value, play=True):
-        for s in sfx.values():
-            s.set_volume(value / 10)
+        sfx.set_volume(value / 10)
         if play:
-            sfx['game_over'].play()
+            effects.play('game_over')
 
     def toggle_grid(_=None):
         global draw_grid, next_rect
@@ -266,6 +147,12 @@ def main():
         fullscreen = not fullscreen
         settings_menu.get_widget(widget_id='fullscreen_toggle').set_value(fullscreen)
         pygame.display.toggle_fullscreen()
+        dirty.invalidate()
+
+    def toggle_dirty_rendering(_=None):
+        global dirty_rendering
+        dirty_rendering = not dirty_rendering
+        settings_menu.get_widget(widget_id='dirty_toggle').set_value(dirty_rendering)
 
     def change_window_size(selected: Tuple, new_width, new_height) -> None:
         global SCREEN_WIDTH
@@ -274,16 +161,17 @@ def main():
         global small_font
         global large_font
         global alpha_surface
-        global bg
         SCREEN_WIDTH = new_width
         SCREEN_HEIGHT = new_height
         screen = new_screen()
-        alpha_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
         game.resize()
+        alpha_surface = prepare_alpha_surface(game)
+        dirty.invalidate()
         small_font = pygame.font.SysFont('Calibri', int(SCREEN_WIDTH * 0.02), True, False)
         large_font = pygame.font.SysFont('Calibri', int(SCREEN_WIDTH * 0.1), True, False)
+        text_cache.clear()
         create_menus(resize=True)
-        bg = prepare_backgrounds()
+        backgrounds.resize((SCREEN_WIDTH, SCREEN_HEIGHT))
 
     def new_screen():
         return pygame.display.set_mode(size=(SCREEN_WIDTH, SCREEN_HEIGHT))
@@ -364,6 +252,8 @@ def main():
                                         toggleswitch_id='grid_toggle')
         settings_menu.add.toggle_switch(title="Ghost Piece", default=show_ghost, onchange=toggle_ghost,
                                         toggleswitch_id='ghost_toggle')
+        settings_menu.add.toggle_switch(title="Dirty Rendering", default=dirty_rendering,
+                                        onchange=toggle_dirty_rendering, toggleswitch_id='dirty_toggle')
         settings_menu.add.label('')
         settings_menu.add.button('Return to Menu', pygame_menu.events.BACK)
 
@@ -386,24 +276,197 @@ def main():
         main_menu.add.button(about_menu.get_title(), about_menu)
         main_menu.add.button(quit_menu.get_title(), quit_menu)
 
+    def hud_texts():
+        # (name, message, font color, shadow color, position, rect) for every drop-shadow label,
+        # rebuilt only when something they show or their layout changes
+        key = (game.score, game.level, game.field_full, game.trouble, game.next_rect.topleft, SCREEN_HEIGHT,
+               small_font)
+        if hud_cache[0] == key:
+            return hud_cache[1]
+        height = small_font.get_height() + 3
+        labels = [('score', "Score: " + str(game.score), Colors.WHITE.value, Colors.BLACK.value, (0, 0)),
+                  ('level', "Level: " + str(game.level), Colors.WHITE.value, Colors.BLACK.value, (0, height * 1.5)),
+                  ('help', "<ESC>: Menu", Colors.WHITE.value, Colors.BLACK.value, (0, SCREEN_HEIGHT - height)),
+                  ('next_label', "Next:", NEXT_LABEL_COLOR, SHADOW_COLOR,
+                   (game.next_rect.x, game.next_rect.y - height)),
+                  ('field_state', f"{game.field_full} / {game.field_size}",
+                   TROUBLE_COLOR if game.trouble else FIELD_OK_COLOR, SHADOW_COLOR, game.next_rect.bottomleft)]
+        hud_cache[:] = [key, [(name, message, color, shadow, pos,
+                               pygame.Rect(pos, (small_font.size(message)[0] + 3, height)))
+                              for name, message, color, shadow, pos in labels]]
+        return hud_cache[1]
+
+    def fall_speed():
+        # Cells per tick the current piece falls at, soft drop included
+        cells = gravity(game.level)
+        if controls.soft_drop:
+            cells = max(cells, controls.soft_drop_speed / TICK_RATE)
+        return cells
+
+    def apply_controls(pending, until):
+        # Apply the stamped control key events up to the time until, oldest first
+        while pending and pending[0][0] <= until:
+            t, event = pending.pop(0)
+            if event.type == pygame.KEYUP:
+                controls.key_up(event.key, t)
+            elif not main_menu.is_enabled():
+                game.event_time = t
+                before = control_state()
+                action = controls.key_down(game, event.key, t)
+                if probe is not None and action is not None and control_state() != before:
+                    probe.handled(action, t)
+
+    def slow_frame_context():
+        return {'state': game.state.name, 'level': game.level, 'score': game.score,
+                'menu_open': main_menu.is_enabled(), 'resolution': screen.get_size(),
+                'dirty_rendering': dirty_rendering, 'stages_ms': profiler.last_frame()}
+
+    def control_state():
+        # What a control key can change, to tell whether a press did anything
+        figure = game.figure
+        return game.field_version, figure, figure and (figure.x, figure.y, figure.rotation)
+
+    def fall_offset():
+        # Pixels the falling piece is drawn below its cell, interpolated between ticks
+        figure = game.figure
+        if figure is None or game.state != GameState.RUNNING or main_menu.is_enabled() \
+                or game.intersects(figure.y + 1):
+            return 0
+        return int(min(game.fall_progress + stepper.alpha() * fall_speed(), 1) * game.block_size)
+
+    def track_frame(hud, ghost_y, offset):
+        screen_rect = screen.get_rect()
+        dirty.track('background', backgrounds.index(game.level), screen_rect)
+        dirty.track('overlay', game.state, None if game.state == GameState.RUNNING else screen_rect)
+        dirty.track('field', (game, game.field_version, draw_grid), game.play_field_rect)
+        dirty.track('next', game.next_figure, game.next_rect)
+        figure = game.figure
+        if figure is None:
+            # restarted this frame, the first piece spawns next frame
+            dirty.track('figure', None)
+            dirty.track('ghost', None)
+        else:
+            dirty.track('figure', (figure, figure.x, figure.y, figure.rotation, offset),
+                        game.figure_rect(figure, figure.y, offset))
+            dirty.track('ghost', (figure, figure.x, ghost_y, figure.rotation),
+                        None if ghost_y is None else game.figure_rect(figure, ghost_y))
+        for name, message, color, _, _, rect in hud:
+            dirty.track(name, (message, tuple(color)), rect)
+        # the overlay shows a new frame time every frame
+        dirty.track('profiler', show_profiler and profiler.count,
+                    profiler.overlay_rect(screen, small_font) if show_profiler else None)
+
+    def draw_frame(hud, ghost_y, offset):
+        screen.fill(Colors.WHITE.value)
+        screen.blit(backgrounds.get(game.level), (0, 0))
+        screen.blit(alpha_surface, (0, 0))
+        profiler.mark('background')
+
+        # Draw play-field with grid and frozen figures, rebuilt only when they change
+        screen.blit(board_layer.get(game, backgrounds.get(game.level), alpha_surface, draw_grid,
+                                    Colors.GRAY.value, Colors.GRAY.value, Colors.WHITE),
+                    game.play_field_rect)
+        profiler.mark('field')
+
+        # Draw Next Figure frame
+        next_rect = game.next_rect
+        pygame.draw.rect(screen, NEXT_FRAME_COLOR, next_rect, 5)
+
+        # Draw active figure with 1px offset in respect to grid; cells reuse one Rect
+        if game.figure is not None:
+            size = game.block_size
+            for j, i in game.figure.shape().cells:
+                cell.update(game.x + size * (j + game.figure.x) + 1, game.y + size * (i + game.figure.y) + 1 + offset,
+                            size - 1, size - 1)
+                pygame.draw.rect(screen, game.figure.color.value, cell)
+                # Draw "ghost" figure
+                if ghost_y is not None:
+                    cell.update(game.x + size * (j + game.figure.x) + 1, game.y + size * (i + ghost_y) + 1,
+                                size - 2, size - 2)
+                    pygame.draw.rect(screen, GHOST_COLOR, cell, 1)
+
+            # Draw next figure preview
+            for j, i in game.next_figure.shape().cells:
+                cell.update(size * (j + game.next_figure.x) + next_rect.centerx - size * 2,
+                            size * (i + game.next_figure.y) + next_rect.centery - size * 2,
+                            size - 1, size - 1)
+                pygame.draw.rect(screen, game.next_figure.color.value, cell)
+        profiler.mark('pieces')
+
+        # Blit text
+        if game.state == GameState.GAME_OVER:
+            text_game_over1 = cached_render(large_font, "Game Over", Colors.WHITE.value, Colors.BLACK.value)
+            text_game_over2 = cached_render(small_font, "Press 'r' to Restart...", Colors.WHITE.value,
+                                            Colors.BLACK.value)
+            screen.blit(text_game_over1, text_game_over1.get_rect(center=(SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)))
+            screen.blit(text_game_over2, text_game_over2.get_rect(
+                center=(SCREEN_WIDTH / 2,
+                        SCREEN_HEIGHT / 2 + text_game_over1.get_size()[1] / 2 + text_game_over2.get_size()[1] / 2)
+            ))
+        if game.state == GameState.PAUSE:
+            text_pause = cached_render(large_font, "PAUSE", Colors.BLACK.value, Colors.GRAY.value)
+            screen.blit(text_pause, text_pause.get_rect(center=(SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)))
+        for _, message, color, shadow, pos, _ in hud:
+            screen.blit(cached_drop_shadow(small_font, message, 3, color, shadow), pos)
+        profiler.mark('hud')
+
+        # Draw menu
+        if main_menu.is_enabled():
+            main_menu.draw(screen)
+        profiler.mark('menu')
+
+        if show_profiler:
+            profiler.draw_overlay(screen, small_font)
+            profiler.mark('overlay')
+
     # Initialize game
     global fullscreen
     global draw_grid
     global show_ghost
+    global show_profiler
     global screen
     global SCREEN_WIDTH
     global SCREEN_HEIGHT
     global alpha_surface
+    pygame.mixer.pre_init(buffer=MIXER_BUFFER)
+    pygame.init()
     screen = new_screen()
-    alpha_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
     pygame.display.set_caption("Tetris")
+
+    # Decode sounds, music, fonts and the first background concurrently behind a loading screen
+    music_player.start()
+    music_player.preload(0)
+    effects.start()
+    sfx.start()
+    loader.submit('small_font', pygame.font.SysFont, 'Calibri', int(SCREEN_WIDTH * 0.02), True, False)
+    loader.submit('large_font', pygame.font.SysFont, 'Calibri', int(SCREEN_WIDTH * 0.1), True, False)
+    backgrounds.resize((SCREEN_WIDTH, SCREEN_HEIGHT))
+    backgrounds.prefetch(1)
+    show_loading_screen(screen, loader, lambda: backgrounds.ready(1) and music_player.ready(0))
+
     game = new_game()
-    clock = pygame.time.Clock()
+    alpha_surface = prepare_alpha_surface(game)
+    dirty = DirtyTracker()
+    board_layer = BoardLayer()
+    stepper = FixedStep()
+    inputs = InputQueue()
+    controls = Controls(DAS, ARR, SOFT_DROP_SPEED)
+    probe = LatencyProbe(LATENCY_CSV) if LATENCY_CSV else None
+    profiler = FrameProfiler(('update', 'background', 'field', 'pieces', 'hud', 'menu', 'overlay', 'flip'),
+                             path=PROFILE_CSV)
+    allocations = None
+    if ALLOC_DEBUG:
+        allocations = AllocationCounter()
+        allocations.start()
+    watchdog = None
+    if WATCHDOG_LOG:
+        watchdog = FrameWatchdog(WATCHDOG_LOG, WATCHDOG_BUDGET / (MAX_FPS or TICK_RATE))
+        watchdog.start()
     done = False
-    pressing_down = False
-    fps = 25
-    counter = 0
-    next_rect = None
+    autoplay = False
+    planner = ai.Planner()
+    ai_figure = None
+    ai_moves = []
 
     set_music_volume(MUSIC_DEFAULT)
     set_sfx_volume(SFX_DEFAULT, play=False)
@@ -419,48 +482,79 @@ def main():
     # Text
     global small_font
     global large_font
-    small_font = pygame.font.SysFont('Calibri', int(SCREEN_WIDTH * 0.02), True, False)
-    large_font = pygame.font.SysFont('Calibri', int(SCREEN_WIDTH * 0.1), True, False)
+    small_font = loader.get('small_font')
+    large_font = loader.get('large_font')
+    text_cache.clear()
+    first_frame = True
+    next_frame = pygame.time.get_ticks() / 1000
+    # (key, labels) of the last hud_texts() and the Rect every piece cell is drawn with
+    hud_cache = [None, None]
+    cell = pygame.Rect(0, 0, 0, 0)
 
     # Main game loop
     while not done:
+        profiler.start()
+        if watchdog is not None:
+            watchdog.frame_start()
+        if allocations is not None:
+            allocations.frame_start()
+        if profiler.resolution != screen.get_size():
+            profiler.reset(screen.get_size())
         if game.figure is None:
             game.new_figure()
-        counter += 1
-        if counter > 100000:
-            counter = 0
         # print(sum(x.count(Colors.WHITE) for x in game.field))
         # if game.trouble:
         #     print(f"{current_music} - trouble...")
         # else:
         #     print(f"{current_music} - all good!")
 
-        if (counter % (fps // game.level // 2) == 0 or pressing_down) and not main_menu.is_enabled():
-            game.move(Direction.DOWN)
-
-        events = pygame.event.get()
-        for event in events:
+        # Input that arrived since the last frame, each event stamped with when it happened
+        inputs.poll()
+        stamped = inputs.take()
+        events = [event for _, event in stamped]
+        pending = [(t, event) for t, event in stamped
+                   if event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key in KEYS]
+
+        # Simulate the fixed ticks that fit in the time since the last frame, whatever the frame rate,
+        # with every control applied in the tick it happened in
+        for tick_time in stepper.ticks(pygame.time.get_ticks() / 1000):
+            apply_controls(pending, tick_time)
+            if main_menu.is_enabled():
+                continue
+            game.event_time = tick_time
+            controls.update(game, tick_time)
+            game.fall(fall_speed())
+
+            # AI player plans once per piece (see planner.update() below) and plays one move per tick
+            if autoplay and game.state == GameState.RUNNING:
+                if game.figure is not ai_figure:
+                    ai_figure = game.figure
+                    ai_moves = []
+                    planner.request(game)
+                if ai_moves:
+                    game.move(ai_moves.pop(0))
+        apply_controls(pending, float('inf'))
+        # the AI's search runs a few milliseconds a frame until it has the moves
+        if autoplay:
+            moves = planner.update(game)
+            if moves is not None:
+                ai_moves = moves
+
+        for t, event in stamped:
             if event.type == pygame.QUIT:
                 done = True
+            if event.type == pygame.WINDOWFOCUSLOST:
+                # the key-up events of keys held now go to another window
+                controls.release_all()
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_LEFT and not main_menu.is_enabled():
-                    game.move(Direction.LEFT)
-                elif event.key == pygame.K_RIGHT and not main_menu.is_enabled():
-                    game.move(Direction.RIGHT)
-                elif event.key == pygame.K_DOWN and not main_menu.is_enabled():
-                    pressing_down = True
-                elif event.key == pygame.K_UP and not main_menu.is_enabled():
-                    game.move(Direction.ROTATE)
-                elif event.key == pygame.K_SPACE and not main_menu.is_enabled():
-                    game.move(Direction.DROP)
-                elif event.key == pygame.K_p and not main_menu.is_enabled():
-                    sfx['pause'].play()
+                if event.key == pygame.K_p and not main_menu.is_enabled():
+                    effects.play('pause', t)
                     if game.state == GameState.RUNNING:
                         game.state = GameState.PAUSE
-                        mixer.music.pause()
+                        music_player.pause()
                     elif game.state == GameState.PAUSE:
                         game.state = GameState.RUNNING
-                        mixer.music.unpause()
+                        music_player.unpause()
                 elif event.key == pygame.K_ESCAPE:
                     if main_menu.is_enabled():
                         if main_menu.get_current() == main_menu:
@@ -470,117 +564,92 @@ def main():
                             main_menu.enable()
                     else:
                         main_menu.enable()
+                        controls.release_all()
                 elif event.key == pygame.K_r:
                     game = new_game()
+                    controls.release_all()
                 elif event.key == pygame.K_g:
                     toggle_grid()
                 elif event.key == pygame.K_h:
                     toggle_ghost()
                 elif event.key == pygame.K_f:
                     toggle_fullscreen()
-
-            elif event.type == pygame.KEYUP:
-                if event.key == pygame.K_DOWN:
-                    pressing_down = False
-
-        # Prepare frame
-        screen.fill("white")
-        screen.blit(bg[(game.level - 1) % len(bg)], (0, 0))
-        screen.blit(alpha_surface, (0, 0))
-
-        # Draw play-field
-        play_field_rect = pygame.draw.rect(alpha_surface, Colors.WHITE.value,
-                                           [game.x - 1, game.y, game.block_size * game.width + 2,
-                                            game.block_size * game.height + 2])
-        pygame.draw.rect(screen, Colors.GRAY.value, play_field_rect, 1)
-
-        for y in range(game.height):
-            for x in range(game.width):
-                # Draw grid
-                if draw_grid:
-                    pygame.draw.rect(screen, Colors.GRAY.value,
-                                     [game.x + game.block_size * x + 1, game.y + (game.block_size * y),
-                                      game.block_size, game.block_size], 1)
-                # Draw frozen figures
-                if game.field[y][x] != Colors.WHITE:
-                    pygame.draw.rect(screen, game.field[y][x].value,
-                                     [game.x + (game.block_size * x) + 1, game.y + (game.block_size * y) + 1,
-                                      game.block_size - 1, game.block_size - 1])
-
-        # Draw Next Figure frame
-        next_rect = pygame.draw.rect(alpha_surface, Colors.WHITE.value,
-                                     [game.x - game.block_size * 10, game.y, game.block_size * 6,
-                                      game.block_size * 6])
-        pygame.draw.rect(screen, "red4", next_rect, 5)
-
-        # Draw active figure with 1px offset in respect to grid
-        if game.figure is not None:
-            for i in range(4):
-                for j in range(4):
-                    p = i * 4 + j
-                    if p in game.figure.image():
-                        pygame.draw.rect(screen, game.figure.color.value,
-                                         [game.x + game.block_size * (j + game.figure.x) + 1,
-                                          game.y + game.block_size * (i + game.figure.y) + 1,
-                                          game.block_size - 1, game.block_size - 1])
-                        # Draw "ghost" figure
-                        if show_ghost:
-                            pygame.draw.rect(screen, pygame.Color("red"),
-                                             [game.x + game.block_size * (j + game.figure.x) + 1,
-                                              game.y + game.block_size * (i + game.find_ghost_y()) + 1,
-                                              game.block_size - 2, game.block_size - 2], 1)
-
-                    # Draw next figure preview
-                    if p in game.next_figure.image():
-                        pygame.draw.rect(screen, game.next_figure.color.value,
-                                         [game.block_size * (j + game.next_figure.x)
-                                          + next_rect.centerx - game.block_size * 2,
-                                          game.block_size * (i + game.next_figure.y)
-                                          + next_rect.centery - game.block_size * 2,
-                                          game.block_size - 1, game.block_size - 1])
-
-        # Blit text
-        if game.state == GameState.GAME_OVER:
-            if not game.game_over:
-                mixer.music.stop()
-                sfx['game_over'].play()
-                game.game_over = True
-            text_game_over1 = large_font.render("Game Over", True, Colors.WHITE.value, Colors.BLACK.value)
-            text_game_over2 = small_font.render("Press 'r' to Restart...", True, Colors.WHITE.value, Colors.BLACK.value)
-            screen.blit(text_game_over1, text_game_over1.get_rect(center=(SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)))
-            screen.blit(text_game_over2, text_game_over2.get_rect(
-                center=(SCREEN_WIDTH / 2,
-                        SCREEN_HEIGHT / 2 + text_game_over1.get_size()[1] / 2 + text_game_over2.get_size()[1] / 2)
-            ))
-        if game.state == GameState.PAUSE:
-            text_pause = large_font.render("PAUSE", True, Colors.BLACK.value, Colors.GRAY.value)
-            screen.blit(text_pause, text_pause.get_rect(center=(SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)))
-        text_score = text_drop_shadow(small_font, "Score: " + str(game.score), 3, Colors.WHITE.value,
-                                      Colors.BLACK.value)
-        text_level = text_drop_shadow(small_font, "Level: " + str(game.level), 3, Colors.WHITE.value,
-                                      Colors.BLACK.value)
-        text_help = text_drop_shadow(small_font, "<ESC>: Menu", 3, Colors.WHITE.value, Colors.BLACK.value)
-        text_next_piece = text_drop_shadow(small_font, "Next:", 3, pygame.color.Color("red3"),
-                                           pygame.color.Color("black"))
-        text_state = text_drop_shadow(small_font,
-                                      f"{game.field_full} / {game.field_size}",
-                                      3, pygame.color.Color("red4") if game.trouble else pygame.color.Color("green3"),
-                                      pygame.color.Color("black"))
-        screen.blit(text_score, [0, 0])
-        screen.blit(text_level, [0, text_score.get_size()[1] * 1.5])
-        screen.blit(text_help, [0, SCREEN_HEIGHT - text_help.get_size()[1]])
-        screen.blit(text_next_piece, [next_rect.x, next_rect.y - text_next_piece.get_height()])
-        screen.blit(text_state, next_rect.bottomleft)
-
-        # Draw menu
+                elif event.key == pygame.K_a:
+                    autoplay = not autoplay
+                    ai_figure = None
+                elif event.key == pygame.K_o:
+                    show_profiler = not show_profiler
+
+        # Game over side effects happen once, not once per redrawn region
+        if game.state == GameState.GAME_OVER and not game.game_over:
+            music_player.stop()
+            effects.play('game_over', game.event_time)
+            game.game_over = True
+
+        profiler.mark('update')
         if main_menu.is_enabled():
             main_menu.update(events)
-            if main_menu.is_enabled():
-                main_menu.draw(screen)
-
-        pygame.display.flip()
-        clock.tick(fps)
-
+        profiler.mark('menu')
+
+        backgrounds.update(game.score, game.level)
+        music_player.update()
+        ghost_y = game.find_ghost_y() if show_ghost and game.figure is not None else None
+        offset = fall_offset()
+        hud = hud_texts()
+        if dirty_rendering and not main_menu.is_enabled():
+            track_frame(hud, ghost_y, offset)
+            rects = dirty.flush()
+        else:
+            dirty.invalidate()
+            rects = None
+        profiler.mark('update')
+
+        if rects is None:
+            draw_frame(hud, ghost_y, offset)
+            if probe is not None:
+                probe.drawn(pygame.time.get_ticks() / 1000)
+            pygame.display.flip()
+        elif rects:
+            for rect in rects:
+                screen.set_clip(rect)
+                draw_frame(hud, ghost_y, offset)
+            screen.set_clip(None)
+            if probe is not None:
+                probe.drawn(pygame.time.get_ticks() / 1000)
+            pygame.display.update(rects)
+        if probe is not None and rects != []:
+            probe.presented(pygame.time.get_ticks() / 1000)
+        profiler.mark('flip')
+        profiler.end_frame()
+        if allocations is not None:
+            allocations.frame_end()
+        if watchdog is not None:
+            watchdog.frame_end(slow_frame_context)
+        if first_frame:
+            first_frame = False
+            # rarely used assets load in the background now that the game is on screen
+            loader.load_lazy()
+            if PRINT_STATS:
+                print(f'time to first frame: {(time.perf_counter() - START) * 1000:.0f} ms')
+                print(loader.report())
+        # Wait for the next frame, still polling so input gets stamped as it arrives
+        if MAX_FPS:
+            next_frame = max(next_frame + 1 / MAX_FPS, pygame.time.get_ticks() / 1000)
+            inputs.wait(next_frame)
+
+    if PRINT_STATS:
+        print(backgrounds.report())
+        print(effects.report())
+    if probe is not None:
+        probe.export()
+    profiler.close()
+    if watchdog is not None:
+        watchdog.stop()
+    if allocations is not None:
+        print(allocations.report())
+        allocations.stop()
+    backgrounds.shutdown()
+    music_player.shutdown()
     pygame.quit()
 
 
@@ -589,7 +658,8 @@ __author__ = 'Netanel Attali (2022)'
 __email__ = 'netanel.attali@gmail.com'
 __title__ = 'myTetris'
 
-pygame.init()
+# only the display is needed at import time (for the screen size), main() initialises the rest
+pygame.display.init()
 
 music = ['sound/tetris-music.mp3',
          'sound/tetris-music-1.mp3',
@@ -599,17 +669,39 @@ fast_music = ['sound/tetris-music-fast.mp3',
               'sound/tetris-music-1-fast.mp3',
               'sound/tetris-music-2-fast.mp3']
 current_music = 0
-mixer.music.load(music[current_music])
-
-sfx = {
-    'move': mixer.Sound('sound/move.mp3'),
-    'rotate': mixer.Sound('sound/rotate.mp3'),
-    'drop': mixer.Sound('sound/drop.mp3'),
-    'game_over': mixer.Sound('sound/game_over.mp3'),
-    'break_line': mixer.Sound('sound/break_line.mp3'),
-    'nope': mixer.Sound('sound/nope2.mp3'),
-    'pause': mixer.Sound('sound/pause.mp3')
-}
+pcm_cache = PcmCache()
+music_player = MusicPlayer(music, fast_music, pcm_cache)
+
+loader = AssetLoader()
+sfx = SoundBank(loader, {
+    'move': 'sound/move.mp3',
+    'rotate': 'sound/rotate.mp3',
+    'drop': 'sound/drop.mp3',
+    'game_over': 'sound/game_over.mp3',
+    'break_line': 'sound/break_line.mp3',
+    'nope': 'sound/nope2.mp3',
+    'pause': 'sound/pause.mp3'
+}, pcm_cache, lazy={'game_over'})
+
+# Samples per mixer buffer: smaller means less delay between an event and its sound, too
+# small and slow machines underrun (crackle)
+MIXER_BUFFER = 256
+
+# Higher priorities may cut off lower ones when all SFX channels are busy; the intervals
+# (seconds) stop held keys and the AI from retriggering the same click every frame
+effects = SoundDispatcher(sfx, priorities={
+    'move': 0,
+    'rotate': 0,
+    'nope': 1,
+    'drop': 2,
+    'pause': 2,
+    'break_line': 3,
+    'game_over': 4
+}, min_intervals={
+    'move': 0.03,
+    'rotate': 0.03,
+    'nope': 0.1
+}, buffer_size=MIXER_BUFFER, clock=input_time)
 
 SCREEN_WIDTH = pygame.display.Info().current_w
 SCREEN_HEIGHT = pygame.display.Info().current_h
@@ -631,14 +723,49 @@ HELP = ['ESC : Main Menu',
         'F : Toggle Full Screen',
         'G : Toggle Grid',
         'H : Toggle "Ghost" Piece',
+        'A : Toggle AI Player',
+        'O : Toggle Profiler Overlay',
         'LEFT/RIGHT/DOWN : Move Piece',
         'UP : Rotate Piece',
         'SPACE : Drop Piece'
         ]
 
+# Render rate cap, 0 for uncapped; the game itself always runs at timing.TICK_RATE
+MAX_FPS = 60
+# Rows per second while DOWN is held
+SOFT_DROP_SPEED = 25
+# Seconds LEFT/RIGHT must be held before they auto-repeat (DAS), and between repeats (ARR,
+# 0 moves straight to the wall)
+DAS = 0.167
+ARR = 0.033
+# CSV file for input-to-photon latency percentiles per action, None to not measure them
+LATENCY_CSV = None
+# CSV file the frame profiler appends its raw per-stage samples to on exit and on every
+# resolution change, None to only show them in the overlay (O)
+PROFILE_CSV = None
+# JSON-lines log of frames that took longer than WATCHDOG_BUDGET frame periods, with the
+# stacks sampled while they ran; None turns the watchdog off
+WATCHDOG_LOG = None
+WATCHDOG_BUDGET = 1.5
+# Count memory allocated and garbage collections per frame with tracemalloc (slow)
+ALLOC_DEBUG = False
+# Print the time to first frame and asset load times on startup, and the resident background
+# memory and sound effect stats on exit
+PRINT_STATS = False
+
 draw_grid = False
 show_ghost = False
+show_profiler = False
+
+# Colors drawn every frame, parsed once
+GHOST_COLOR = pygame.Color("red")
+NEXT_FRAME_COLOR = pygame.Color("red4")
+NEXT_LABEL_COLOR = pygame.Color("red3")
+FIELD_OK_COLOR = pygame.Color("green3")
+TROUBLE_COLOR = pygame.Color("red4")
+SHADOW_COLOR = pygame.Color("black")
 fullscreen = False
+dirty_rendering = True
 
 MUSIC_DEFAULT = 6
 SFX_DEFAULT = 7
@@ -652,18 +779,21 @@ RESOLUTIONS = [('Full Screen Resolution', SCREEN_WIDTH, SCREEN_HEIGHT),
                ('2560x1440', 2560, 1440)]
 screen = None
 alpha_surface = None
-small_font = pygame.font.SysFont('Calibri', int(SCREEN_WIDTH * 0.02), True, False)
-large_font = pygame.font.SysFont('Calibri', int(SCREEN_WIDTH * 0.1), True, False)
+# loaded by main()
+small_font = None
+large_font = None
+text_cache = TextCache()
 
 
-def prepare_backgrounds():
-    return [pygame.transform.scale(pygame.image.load('images/bg1.jpg'), (SCREEN_WIDTH, SCREEN_HEIGHT)),
-            pygame.transform.scale(pygame.image.load('images/bg2.jpg'), (SCREEN_WIDTH, SCREEN_HEIGHT)),
-            pygame.transform.scale(pygame.image.load('images/bg3.jpg'), (SCREEN_WIDTH, SCREEN_HEIGHT)),
-            pygame.transform.scale(pygame.image.load('images/bg4.jpg'), (SCREEN_WIDTH, SCREEN_HEIGHT))]
+BACKGROUNDS = ['images/bg1.jpg',
+               'images/bg2.jpg',
+               'images/bg3.jpg',
+               'images/bg4.jpg']
+background_cache = BackgroundCache()
 
 
-bg = prepare_backgrounds()
+# sized by main() once the display exists, so the surfaces can be convert()ed
+backgrounds = BackgroundManager(BACKGROUNDS, background_cache)
 
 if __name__ == '__main__':
     main()
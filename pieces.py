@@ -0,0 +1,75 @@
+"""
+Piece geometry tables for myTetris
+
+Everything the game needs to know about a piece rotation (cells, bounding box, column
+bottoms, bitboard row masks) is built once at import and shared by every Figure as a
+flyweight, so nothing re-derives coordinates from the 4x4 index lists at runtime.
+"""
+
+from enum import Enum
+
+
+class Colors(Enum):
+    BLACK = (1, 1, 1)
+    WHITE = (255, 255, 255, 220)
+    GRAY = (128, 128, 128)
+    COLOR_1 = (120, 37, 179)
+    COLOR_2 = (100, 179, 179)
+    COLOR_3 = (80, 34, 22)
+    COLOR_4 = (80, 134, 22)
+    COLOR_5 = (180, 34, 22)
+    COLOR_6 = (180, 34, 122)
+    COLOR_7 = (255, 125, 0)
+
+
+# Each rotation is a list of indices into a 4x4 grid (i * 4 + j)
+FIGURES = [
+    [[1, 5, 9, 13], [4, 5, 6, 7]],
+    [[4, 5, 9, 10], [2, 6, 5, 9]],
+    [[6, 7, 9, 10], [1, 5, 6, 10]],
+    [[1, 2, 5, 9], [0, 4, 5, 6], [1, 5, 9, 8], [4, 5, 6, 10]],
+    [[1, 2, 6, 10], [5, 6, 7, 9], [2, 6, 10, 11], [3, 5, 6, 7]],
+    [[1, 4, 5, 6], [1, 4, 5, 9], [4, 5, 6, 9], [1, 5, 6, 9]],
+    [[1, 2, 5, 6]],
+]
+
+PIECE_COLORS = tuple(c for c in Colors if c not in [Colors.WHITE, Colors.GRAY])
+
+
+class Rotation:
+    __slots__ = ('image', 'cells', 'left', 'top', 'right', 'bottom', 'column_bottoms', 'masks')
+
+    def __init__(self, image):
+        self.image = tuple(image)
+        # (dx, dy) offsets from the figure position, in row-major order
+        self.cells = tuple(sorted(((p % 4, p // 4) for p in image), key=lambda c: (c[1], c[0])))
+        xs = [dx for dx, _ in self.cells]
+        ys = [dy for _, dy in self.cells]
+        self.left, self.right = min(xs), max(xs)
+        self.top, self.bottom = min(ys), max(ys)
+        # (dx, lowest dy) for every column the rotation occupies
+        self.column_bottoms = tuple((dx, max(dy for cx, dy in self.cells if cx == dx))
+                                    for dx in range(self.left, self.right + 1))
+        rows = [0] * 4
+        for dx, dy in self.cells:
+            rows[dy] |= 1 << dx
+        # ((dy, row_mask), ...) for the non-empty rows, used by the bitboard
+        self.masks = tuple((dy, m) for dy, m in enumerate(rows) if m)
+
+
+class Piece:
+    __slots__ = ('type', 'rotations', 'count')
+
+    def __init__(self, figure_type, images):
+        self.type = figure_type
+        self.rotations = tuple(Rotation(image) for image in images)
+        self.count = len(self.rotations)
+
+    @staticmethod
+    def spawn(width):
+        return width // 2 - 2, 0
+
+
+PIECES = tuple(Piece(t, images) for t, images in enumerate(FIGURES))
+MASKS = tuple(tuple(r.masks for r in p.rotations) for p in PIECES)
+BOTTOMS = tuple(tuple(r.column_bottoms for r in p.rotations) for p in PIECES)
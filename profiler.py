@@ -0,0 +1,129 @@
+"""
+Frame profiler for myTetris
+
+FrameProfiler adds up the time spent in each stage of a frame with perf_counter_ns(): a
+stage is charged everything since the previous mark() or start(), so drawing a frame in
+several clipped passes (dirty rendering) still adds up per stage. end_frame() stores the
+totals and the time since the previous frame in preallocated ring buffers, so recording
+costs a few integer writes per stage.
+
+draw_overlay() shows rolling averages and a frame-time graph of the last frames. When a
+path is given, the raw samples are appended to it as CSV, tagged with the resolution, on
+every reset() (e.g. a resolution change) and on close().
+"""
+
+import csv
+import os
+import time
+from array import array
+
+import pygame
+
+
+class FrameProfiler:
+    def __init__(self, stages, size=600, path=None):
+        self.stages = tuple(stages)
+        self.index = {stage: i for i, stage in enumerate(self.stages)}
+        self.size = size
+        self.path = path
+        self.samples = [array('q', bytes(8 * size)) for _ in self.stages]
+        self.frame_times = array('q', bytes(8 * size))
+        self.current = [0] * len(self.stages)
+        self.count = 0
+        self.resolution = None
+        self.last = self.frame_start = time.perf_counter_ns()
+        self.overlay_text = None
+        self.overlay_updated = 0
+        self.panel = None
+
+    def start(self):
+        # Time up to here belongs to no stage
+        self.last = time.perf_counter_ns()
+
+    def mark(self, stage):
+        now = time.perf_counter_ns()
+        self.current[self.index[stage]] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        now = time.perf_counter_ns()
+        slot = self.count % self.size
+        for i, samples in enumerate(self.samples):
+            samples[slot] = self.current[i]
+            self.current[i] = 0
+        self.frame_times[slot] = now - self.frame_start
+        self.frame_start = now
+        self.count += 1
+
+    def recent(self, n):
+        # Ring buffer slots of the last n recorded frames, oldest first
+        n = min(n, self.count, self.size)
+        return [(self.count - n + i) % self.size for i in range(n)]
+
+    def last_frame(self):
+        # {stage: ms} of the frame end_frame() recorded last
+        slot = (self.count - 1) % self.size
+        return {stage: self.samples[i][slot] / 1e6 for i, stage in enumerate(self.stages)}
+
+    def averages(self, n=60):
+        # ({stage: ms}, frame ms) averaged over the last n frames
+        slots = self.recent(n)
+        if not slots:
+            return {stage: 0.0 for stage in self.stages}, 0.0
+        stages = {stage: sum(self.samples[i][s] for s in slots) / len(slots) / 1e6
+                  for i, stage in enumerate(self.stages)}
+        return stages, sum(self.frame_times[s] for s in slots) / len(slots) / 1e6
+
+    def reset(self, resolution):
+        self.dump()
+        self.count = 0
+        self.resolution = tuple(resolution)
+
+    def dump(self):
+        if self.path is None or not self.count or self.resolution is None:
+            return
+        new_file = not os.path.exists(self.path)
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(['width', 'height', 'frame_ns'] + [f'{stage}_ns' for stage in self.stages])
+            for slot in self.recent(self.size):
+                writer.writerow([*self.resolution, self.frame_times[slot]] + [s[slot] for s in self.samples])
+
+    def close(self):
+        self.dump()
+        self.count = 0
+
+    def overlay_rect(self, screen, font, graph_height=60):
+        width = font.size('x' * 22)[0]
+        height = font.get_linesize() * (len(self.stages) + 1) + graph_height
+        return pygame.Rect(screen.get_width() - width - 10, 10, width, height)
+
+    def draw_overlay(self, screen, font, graph_height=60, target_ms=1000 / 60):
+        rect = self.overlay_rect(screen, font, graph_height)
+        # the numbers only change a few times a second, so they stay readable and cheap
+        now = time.perf_counter()
+        if self.overlay_text is None or now - self.overlay_updated > 0.25:
+            self.overlay_updated = now
+            stages, frame = self.averages()
+            lines = [f'frame {frame:6.2f} ms'] + [f'{stage:10} {ms:6.2f} ms' for stage, ms in stages.items()]
+            self.overlay_text = [font.render(line, True, (255, 255, 255)) for line in lines]
+        if self.panel is None or self.panel.get_size() != rect.size:
+            self.panel = pygame.Surface(rect.size)
+            self.panel.set_alpha(192)
+        screen.blit(self.panel, rect)
+        y = rect.y
+        for text in self.overlay_text:
+            screen.blit(text, (rect.x + 4, y))
+            y += font.get_linesize()
+        # one column per frame, full height is two target frames
+        scale = graph_height / (2 * target_ms * 1e6)
+        slots = self.recent(rect.width)
+        x = rect.right - len(slots)
+        for slot in slots:
+            height = min(int(self.frame_times[slot] * scale), graph_height)
+            color = (255, 80, 80) if self.frame_times[slot] > target_ms * 1e6 else (80, 255, 80)
+            pygame.draw.line(screen, color, (x, rect.bottom - 1), (x, rect.bottom - 1 - height))
+            x += 1
+        target_y = rect.bottom - 1 - graph_height // 2
+        pygame.draw.line(screen, (255, 255, 255), (rect.x, target_y), (rect.right - 1, target_y))
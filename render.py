@@ -0,0 +1,100 @@
+"""
+Rendering helpers for myTetris
+
+DirtyTracker remembers what every region of the screen last showed (a key plus the rect
+it was drawn in). Each frame the game tracks its regions again; anything whose key or
+rect changed yields its old and new rect, and the frame is redrawn and pushed to the
+display only inside those rects with pygame.display.update(rects).
+"""
+
+from collections import OrderedDict
+
+import pygame
+
+
+class DirtyTracker:
+    def __init__(self):
+        self.items = {}
+        self.rects = []
+        self.full = True
+
+    def invalidate(self):
+        # Next flush() asks for a full redraw
+        self.full = True
+
+    def track(self, name, key, rect=None):
+        old = self.items.get(name)
+        if old is not None and old[0] == key and old[1] == rect:
+            return
+        if old is not None and old[1] is not None:
+            self.rects.append(old[1])
+        if rect is not None:
+            self.rects.append(pygame.Rect(rect))
+        self.items[name] = (key, rect and pygame.Rect(rect))
+
+    def flush(self):
+        # None means redraw everything, otherwise the (possibly empty) list of dirty rects
+        rects = None if self.full else self.rects
+        self.rects = []
+        self.full = False
+        return rects
+
+
+# Pre-rendered play-field (background slice, tint, border, grid and locked blocks), rebuilt
+# only when the frozen cells, the layout, the background or the grid toggle change
+class BoardLayer:
+    def __init__(self):
+        self.key = None
+        self.surface = None
+
+    def get(self, game, background, tint, draw_grid, border_color, grid_color, empty_color):
+        rect = game.play_field_rect
+        key = (game, game.field_version, game.block_size, tuple(rect), background, tint, draw_grid)
+        if key != self.key:
+            self.key = key
+            self.surface = self.build(game, rect, background, tint, draw_grid, border_color, grid_color,
+                                      empty_color)
+        return self.surface
+
+    @staticmethod
+    def build(game, rect, background, tint, draw_grid, border_color, grid_color, empty_color):
+        surface = pygame.Surface(rect.size)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        surface.blit(background, (0, 0), rect)
+        surface.blit(tint, (0, 0), rect)
+        pygame.draw.rect(surface, border_color, surface.get_rect(), 1)
+        size = game.block_size
+        # cells start 1px right of the border, same as the screen coordinates in main()
+        ox = game.x - rect.x
+        oy = game.y - rect.y
+        for y, row in enumerate(game.field):
+            for x, color in enumerate(row):
+                if draw_grid:
+                    pygame.draw.rect(surface, grid_color, (ox + size * x + 1, oy + size * y, size, size), 1)
+                if color != empty_color:
+                    pygame.draw.rect(surface, color.value,
+                                     (ox + size * x + 1, oy + size * y + 1, size - 1, size - 1))
+        return surface
+
+
+# Bounded LRU of rendered text surfaces keyed by (font, text, colors, ...), so an unchanged
+# label costs one dict lookup per frame. Fonts are part of the key, so clear() it whenever
+# they are recreated.
+class TextCache:
+    def __init__(self, size=64):
+        self.size = size
+        self.surfaces = OrderedDict()
+
+    def get(self, key, render, *args):
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = render(*args)
+            if len(self.surfaces) > self.size:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
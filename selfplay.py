@@ -0,0 +1,125 @@
+"""
+Self-play harness for myTetris
+
+Runs M headless games of engine.Tetris(width=10, height=20) across a process pool,
+driven by a pluggable policy, and prints aggregated score / lines / pieces-per-second
+histograms. Games are handed out in chunks and results stream back as chunks finish.
+
+A policy is any importable callable given as 'module:function'. It is called once per
+new piece as policy(game) and returns the Directions to apply to game.figure; if the
+piece is still falling afterwards it is dropped.
+
+    python selfplay.py --games 10000 --policy selfplay:random_policy
+"""
+
+import argparse
+import importlib
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from engine import Direction, GameEvent, GameState, Tetris
+
+STATS = ('score', 'lines', 'pieces', 'pps')
+
+
+def random_policy(game):
+    moves = [Direction.ROTATE] * random.randrange(game.figure.piece.count)
+    side = random.randint(-game.width // 2, game.width // 2)
+    moves += [Direction.LEFT if side < 0 else Direction.RIGHT] * abs(side)
+    return moves
+
+
+def load_policy(path):
+    module, _, name = path.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def play_game(policy, seed, max_pieces):
+    random.seed(seed)
+    game = Tetris(width=10, height=20)
+    lines = 0
+
+    def count_lines(_, event):
+        nonlocal lines
+        if event == GameEvent.BREAK_LINE:
+            lines += 1
+
+    game.subscribe(count_lines)
+    game.new_figure()
+    pieces = 0
+    start = time.perf_counter()
+    while game.state == GameState.RUNNING and pieces < max_pieces:
+        figure = game.figure
+        for direction in policy(game):
+            game.move(direction)
+            if game.figure is not figure:
+                break
+        if game.figure is figure:
+            game.move(Direction.DROP)
+        pieces += 1
+    elapsed = time.perf_counter() - start
+    return {'seed': seed, 'score': game.score, 'lines': lines, 'pieces': pieces,
+            'pps': pieces / elapsed if elapsed else 0.0}
+
+
+def play_chunk(policy_path, seeds, max_pieces):
+    policy = load_policy(policy_path)
+    return [play_game(policy, seed, max_pieces) for seed in seeds]
+
+
+def histogram(values, bins=10):
+    lo, hi = min(values), max(values)
+    width = (hi - lo) / bins or 1
+    counts = [0] * bins
+    for v in values:
+        counts[min(int((v - lo) / width), bins - 1)] += 1
+    return [(lo + i * width, lo + (i + 1) * width, c) for i, c in enumerate(counts)]
+
+
+def print_histogram(name, values, bins=10, bar=40):
+    print(f'{name}: mean {sum(values) / len(values):,.1f}, min {min(values):,.1f}, max {max(values):,.1f}')
+    rows = histogram(values, bins)
+    peak = max(c for _, _, c in rows)
+    for lo, hi, count in rows:
+        print(f'  {lo:12,.1f} - {hi:12,.1f} | {"#" * (count * bar // peak):<{bar}} {count}')
+
+
+def run(games, policy_path, workers=None, chunk_size=16, seed=0, max_pieces=10000, progress=True):
+    results = []
+    chunks = [range(seed + i, seed + min(i + chunk_size, games)) for i in range(0, games, chunk_size)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(play_chunk, policy_path, list(chunk), max_pieces) for chunk in chunks]
+        for done, future in enumerate(as_completed(futures), 1):
+            results.extend(future.result())
+            if progress:
+                print(f'\r{len(results)}/{games} games ({done}/{len(chunks)} chunks)', end='', flush=True)
+    if progress:
+        print()
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run headless myTetris games across a process pool')
+    parser.add_argument('-g', '--games', type=int, default=1000)
+    parser.add_argument('-p', '--policy', default='selfplay:random_policy', help="policy as 'module:function'")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('-c', '--chunk-size', type=int, default=16)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--max-pieces', type=int, default=10000)
+    parser.add_argument('--bins', type=int, default=10)
+    args = parser.parse_args()
+
+    load_policy(args.policy)
+    results, elapsed = run(args.games, args.policy, args.workers, args.chunk_size, args.seed, args.max_pieces)
+    pieces = sum(r['pieces'] for r in results)
+    print(f'{len(results)} games, {pieces:,} pieces in {elapsed:.2f}s '
+          f'({pieces / elapsed:,.0f} pieces/s over {args.workers} workers)')
+    for stat in STATS:
+        print_histogram(stat, [r[stat] for r in results], args.bins)
+
+
+if __name__ == '__main__':
+    main()
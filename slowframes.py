@@ -0,0 +1,90 @@
+"""
+Slow-frame watchdog for myTetris
+
+While it runs, a daemon thread samples the game thread's Python stack every few
+milliseconds into a bounded buffer. A frame whose work (everything but the wait for the
+next frame) takes longer than the budget is written to a JSON-lines log with the stacks
+sampled during it, as 'file:line:function;...' strings (outermost call first) with their
+sample counts, plus whatever context the game passes in. The log is rotated to path + '.1'
+when it grows past max_bytes, so it never takes more than twice that on disk.
+
+Sampling needs the GIL, so inside long pure-Python stretches samples come at most every
+sys.getswitchinterval() (5 ms by default).
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+
+class FrameWatchdog:
+    def __init__(self, path, budget, interval=0.002, max_bytes=1 << 20, depth=40, top=10):
+        self.path = path
+        self.budget = budget
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.depth = depth
+        self.top = top
+        self.target = threading.get_ident()
+        # about a second of samples, far more than any frame we care about
+        self.samples = deque(maxlen=max(int(1 / interval), 1))
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.started = 0.0
+        self.slow_frames = 0
+
+    def start(self):
+        # Call from the game thread, which is the one that gets sampled
+        self.target = threading.get_ident()
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, name='frame-watchdog', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.depth:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{frame.f_lineno}:{code.co_name}')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _sample(self):
+        while self.running:
+            frame = sys._current_frames().get(self.target)
+            if frame is not None:
+                sample = (time.perf_counter(), self._stack(frame))
+                with self.lock:
+                    self.samples.append(sample)
+            del frame
+            time.sleep(self.interval)
+
+    def frame_start(self):
+        self.started = time.perf_counter()
+
+    def frame_end(self, context):
+        # context() is only called for slow frames and returns a JSON-able dict
+        elapsed = time.perf_counter() - self.started
+        if elapsed <= self.budget:
+            return
+        self.slow_frames += 1
+        with self.lock:
+            stacks = Counter(stack for t, stack in self.samples if t >= self.started)
+        entry = {'time': time.time(), 'frame_ms': round(elapsed * 1000, 2), 'budget_ms': round(self.budget * 1000, 2),
+                 'context': context(), 'samples': sum(stacks.values()),
+                 'stacks': [{'count': count, 'stack': stack} for stack, count in stacks.most_common(self.top)]}
+        self.write(entry)
+
+    def write(self, entry):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+            os.replace(self.path, self.path + '.1')
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
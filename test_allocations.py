@@ -0,0 +1,64 @@
+"""
+Checks that a steady-state frame of myTetris allocates nothing that lives on
+
+Run with pytest. The game runs headless on SDL's dummy drivers with a simulated clock: the
+main menu is closed on the second frame and the game is left to fall without input. The
+frames recorded by AllocationCounter once it has settled must not leave memory blocks
+behind or run the garbage collector.
+"""
+
+import os
+
+import pygame
+
+import controls
+import myTetris
+
+FRAMES = 300
+MEASURED = 100
+
+
+def test_steady_state_frames_do_not_allocate(monkeypatch):
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    monkeypatch.setenv('SDL_AUDIODRIVER', 'dummy')
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    monkeypatch.setattr(myTetris, 'ALLOC_DEBUG', True)
+
+    counters = []
+
+    class Counter(myTetris.AllocationCounter):
+        def start(self):
+            counters.append(self)
+            super().start()
+
+    monkeypatch.setattr(myTetris, 'AllocationCounter', Counter)
+
+    # 60 frames per second of simulated time, so the test does not wait between frames
+    clock = [0]
+
+    def wait(self, until, interval=0.002):
+        clock[0] += 1000 // 60
+        self.poll()
+
+    monkeypatch.setattr(pygame.time, 'get_ticks', lambda: clock[0])
+    monkeypatch.setattr(controls.InputQueue, 'wait', wait)
+
+    get_events = pygame.event.get
+    frame = [0]
+
+    def scripted_events(*args, **kwargs):
+        get_events(*args, **kwargs)
+        frame[0] += 1
+        if frame[0] == 2:
+            return [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_ESCAPE, mod=0, unicode='', scancode=0)]
+        if frame[0] >= FRAMES:
+            return [pygame.event.Event(pygame.QUIT)]
+        return []
+
+    monkeypatch.setattr(pygame.event, 'get', scripted_events)
+    myTetris.main()
+
+    summary = counters[0].summary(MEASURED)
+    assert summary['frames'] == MEASURED
+    assert abs(summary['net_blocks']) < 0.5
+    assert summary['collections'] == 0
@@ -0,0 +1,119 @@
+"""
+Checks of the board state that BitBoard and Tetris keep up to date incrementally
+
+Run with pytest. The tops, fills and holes are compared with a board rebuilt from the
+rows after every piece of games played by the AI (so lines get cleared) and by random
+moves (so the field gets holes and overhangs); the cached ghost row and the line clear
+are compared with straightforward versions of them.
+"""
+
+import random
+
+import ai
+from bitboard import PAD, BitBoard
+from engine import Direction, GameState, Tetris
+from pieces import Colors
+
+
+def rescanned(board):
+    fresh = BitBoard(board.width, board.height)
+    fresh.rows[:] = board.rows
+    fresh.rescan()
+    return fresh
+
+
+def assert_matches_rescan(game):
+    board = game.board
+    fresh = rescanned(board)
+    assert board.tops == fresh.tops
+    assert board.row_fill == fresh.row_fill
+    assert board.column_fill == fresh.column_fill
+    assert board.filled_cells == fresh.filled_cells
+    assert board.holes == fresh.holes
+    assert board.full_rows == fresh.full_rows == set()
+    for y, row in enumerate(game.field):
+        for x, color in enumerate(row):
+            assert (color != Colors.WHITE) == bool(board.rows[y] & (1 << (x + PAD)))
+
+
+def random_moves(game):
+    return [random.choice([Direction.LEFT, Direction.RIGHT, Direction.ROTATE])
+            for _ in range(random.randrange(8))] + [Direction.DROP]
+
+
+def play(seed, policy, pieces=150, width=10, height=20):
+    # Yields the game after every piece
+    random.seed(seed)
+    game = Tetris(width, height)
+    game.new_figure()
+    for _ in range(pieces):
+        if game.state != GameState.RUNNING:
+            return
+        figure = game.figure
+        for direction in policy(game):
+            game.move(direction)
+            if game.figure is not figure:
+                break
+        yield game
+
+
+def test_features_match_rescan_after_ai_games():
+    lines = 0
+    for seed in range(3):
+        for game in play(seed, ai.policy):
+            assert_matches_rescan(game)
+            lines += len(game.cleared_rows)
+    assert lines > 0
+
+
+def test_features_match_rescan_after_random_games():
+    holes = 0
+    for seed in range(20):
+        for game in play(seed, random_moves, width=(4, 6, 10)[seed % 3], height=12):
+            assert_matches_rescan(game)
+            holes += game.features.holes
+    assert holes > 0
+
+
+def scanned_ghost_y(game):
+    figure = game.figure
+    y = figure.y
+    while not game.board.collides(figure.type, figure.rotation, figure.x, y + 1):
+        y += 1
+    return y
+
+
+def test_ghost_matches_a_scan():
+    # find_ghost_y() is cached and lands from the column tops; check it at every position a
+    # piece passes through, sliding and rotating as it falls
+    checked = 0
+    for seed in range(20):
+        random.seed(seed)
+        game = Tetris(10, 20)
+        game.new_figure()
+        while game.state == GameState.RUNNING:
+            assert game.find_ghost_y() == scanned_ghost_y(game)
+            checked += 1
+            game.move(random.choice([Direction.LEFT, Direction.RIGHT, Direction.ROTATE, Direction.DOWN,
+                                     Direction.DOWN, Direction.DOWN]))
+    assert checked > 1000
+
+
+def test_clear_full_rows_on_tall_boards():
+    for seed in range(200):
+        rng = random.Random(seed)
+        height = rng.choice([6, 20, 100])
+        board = BitBoard(10, height)
+        for row in range(height // 3, height):
+            if rng.random() < 0.4:
+                board.rows[row] = board.solid
+            else:
+                board.rows[row] = board.wall | rng.getrandbits(10) << PAD
+        board.rescan()
+        full = sorted(board.full_rows)
+        expected = [board.wall] * len(full) + [r for i, r in enumerate(board.rows[:height]) if i not in full]
+        assert board.clear_full_rows() == full
+        assert board.rows[:height] == expected
+        fresh = rescanned(board)
+        assert (board.tops, board.row_fill, board.column_fill, board.filled_cells, board.holes, board.full_rows) == \
+            (fresh.tops, fresh.row_fill, fresh.column_fill, fresh.filled_cells, fresh.holes, fresh.full_rows)
@@ -58,6 +58,8 @@ class Tetris:
         self.field = []
         self.score = 0
         self.state = "start"
+        # filled cells in every row, so full rows are found without looking at every cell
+        self.row_fill = [0] * height
         for i in range(height):
             new_line = []
             for j in range(width):
@@ -80,18 +82,16 @@ class Tetris:
         return intersection
 
     def break_lines(self):
-        lines = 0
-        for i in range(1, self.height):
-            zeros = 0
-            for j in range(self.width):
-                if self.field[i][j] == 0:
-                    zeros += 1
-            if zeros == 0:
-                lines += 1
-                for i1 in range(i, 1, -1):
-                    for j in range(self.width):
-                        self.field[i1][j] = self.field[i1 - 1][j]
-        self.score += lines ** 2
+        # Clears every full row and returns their indices; going down, removing a row and
+        # putting an empty one on top leaves the rows below where they were
+        full = [i for i in range(self.height) if self.row_fill[i] == self.width]
+        for i in full:
+            del self.field[i]
+            self.field.insert(0, [0] * self.width)
+            del self.row_fill[i]
+            self.row_fill.insert(0, 0)
+        self.score += len(full) ** 2
+        return full
 
     def go_space(self):
         while not self.intersects():
@@ -110,6 +110,7 @@ class Tetris:
             for j in range(4):
                 if i * 4 + j in self.figure.image():
                     self.field[i + self.figure.y][j + self.figure.x] = self.figure.color
+                    self.row_fill[i + self.figure.y] += 1
         self.break_lines()
         self.new_figure()
         if self.intersects():
@@ -0,0 +1,57 @@
+"""
+Simulation timing for myTetris
+
+The game runs in fixed ticks of 1/TICK_RATE seconds whatever the render rate: FixedStep
+turns the real time that passed between two frames into a number of whole ticks and keeps
+the remainder for the next frame, exposed as alpha() for interpolating what is drawn.
+gravity() is the fall speed of a level in cells per tick, fractional at low levels and
+several cells per tick ("20G" at most) at high ones.
+"""
+
+TICK_RATE = 60
+
+# Rows per second for the first levels: the speeds the old 25 fps frame counter gave
+ROWS_PER_SECOND = [25 / 12, 25 / 6, 25 / 4, 25 / 3, 25 / 2, 25 / 2, 25, 25, 25, 25, 25, 25]
+# Cells per tick at which a piece lands the tick it spawns
+MAX_GRAVITY = 20
+
+
+def gravity(level, tick_rate=TICK_RATE):
+    # Cells per tick; past the table the speed doubles every level until MAX_GRAVITY
+    if level <= len(ROWS_PER_SECOND):
+        rows = ROWS_PER_SECOND[level - 1]
+    else:
+        rows = ROWS_PER_SECOND[-1] * 2 ** min(level - len(ROWS_PER_SECOND), 16)
+    return min(rows / tick_rate, MAX_GRAVITY)
+
+
+class FixedStep:
+    def __init__(self, tick_rate=TICK_RATE, max_ticks=10):
+        self.dt = 1 / tick_rate
+        # a frame that took longer than this many ticks (a stall, a dragged window) is not
+        # caught up with, so the game does not fast-forward afterwards
+        self.max_ticks = max_ticks
+        self.accumulator = 0.0
+        self.last = None
+
+    def advance(self, now):
+        # Number of ticks to simulate for the time (seconds) up to now
+        if self.last is not None:
+            self.accumulator += now - self.last
+        self.last = now
+        ticks = int(self.accumulator / self.dt)
+        if ticks > self.max_ticks:
+            self.accumulator = 0.0
+            return self.max_ticks
+        self.accumulator -= ticks * self.dt
+        return ticks
+
+    def ticks(self, now):
+        # End time of every tick advance(now) asks for, oldest first
+        count = self.advance(now)
+        end = now - self.accumulator
+        return [end - (count - 1 - i) * self.dt for i in range(count)]
+
+    def alpha(self):
+        # How far (0..1) the time is into the next tick
+        return min(self.accumulator / self.dt, 1.0)